@@ -0,0 +1,175 @@
+from bisect import bisect_right, insort
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+import models
+
+# Margen hacia atrás al cargar turnos, para incluir los que empiezan antes
+# de la ventana pero todavía no terminaron.
+MAX_APPOINTMENT_SPAN = timedelta(days=1)
+
+DEFAULT_DURATION = 30
+
+# Recurso implícito de los negocios que no cargaron profesionales
+SINGLE_RESOURCE = None
+
+
+class ResourceIndex:
+    """
+    Intervalos ocupados por cada recurso (profesional) de un negocio.
+    Cada recurso guarda su ocupación como intervalos disjuntos ordenados,
+    así que preguntar si está libre es una búsqueda binaria.
+    """
+
+    def __init__(self, resource_ids):
+        self.resource_ids = list(resource_ids) or [SINGLE_RESOURCE]
+        self._busy = {rid: [] for rid in self.resource_ids}
+
+    def is_free(self, resource_id, start: datetime, end: datetime) -> bool:
+        busy = self._busy[resource_id]
+        idx = bisect_right(busy, (start, start)) - 1
+        if idx >= 0 and busy[idx][1] > start:
+            return False
+        return idx + 1 >= len(busy) or busy[idx + 1][0] >= end
+
+    def reserve(self, resource_id, start: datetime, end: datetime):
+        busy = self._busy[resource_id]
+        # Fusionar con los intervalos que se solapan o tocan
+        idx = bisect_right(busy, (start, start))
+        if idx > 0 and busy[idx - 1][1] >= start:
+            idx -= 1
+        while idx < len(busy) and busy[idx][0] <= end:
+            old_start, old_end = busy.pop(idx)
+            start, end = min(start, old_start), max(end, old_end)
+        insort(busy, (start, end))
+
+    def find_free(self, eligible, start: datetime, end: datetime):
+        """Primer recurso elegible libre en [inicio, fin). Devuelve False si no hay."""
+        for rid in eligible:
+            if self.is_free(rid, start, end):
+                return rid
+        return False
+
+    def fully_busy(self, eligible, window_start: datetime, window_end: datetime):
+        """
+        Intervalos en los que todos los recursos elegibles están ocupados,
+        calculados con un barrido de eventos sobre todos los recursos a la vez.
+        Sin recursos elegibles el servicio no se puede dar: toda la ventana está ocupada.
+        """
+        eligible = [rid for rid in eligible if rid in self._busy]
+        if not eligible:
+            return [(window_start, window_end)]
+        events = []
+        for rid in eligible:
+            for start, end in self._busy[rid]:
+                events.append((start, 1))
+                events.append((end, -1))
+        # A igual instante, los cierres van antes que las aperturas
+        events.sort(key=lambda e: (e[0], e[1]))
+
+        result = []
+        active = 0
+        opened_at = None
+        for moment, delta in events:
+            active += delta
+            if active == len(eligible) and opened_at is None:
+                opened_at = moment
+            elif active < len(eligible) and opened_at is not None:
+                if moment > opened_at:
+                    result.append((opened_at, moment))
+                opened_at = None
+        return result
+
+    def first_free(self, eligible, starts, duration: timedelta, limit: int):
+        """
+        Recorre los inicios candidatos (en orden creciente) y devuelve los primeros
+        `limit` como (inicio, recurso) en los que algún recurso elegible está libre.
+        Cada recurso avanza un cursor sobre sus intervalos en lugar de buscar desde cero.
+        """
+        eligible = [rid for rid in eligible if rid in self._busy]
+        cursors = dict.fromkeys(eligible, 0)
+        found = []
+        if not eligible or limit <= 0:
+            return found
+        for start in starts:
+            end = start + duration
+            for rid in eligible:
+                busy = self._busy[rid]
+                idx = cursors[rid]
+                while idx < len(busy) and busy[idx][1] <= start:
+                    idx += 1
+                cursors[rid] = idx
+                if idx == len(busy) or busy[idx][0] >= end:
+                    found.append((start, rid))
+                    break
+            if len(found) >= limit:
+                break
+        return found
+
+
+def active_staff_ids(db: Session, owner_id: int):
+    rows = db.query(models.Staff.id).filter(
+        models.Staff.owner_id == owner_id,
+        models.Staff.is_active == True
+    ).order_by(models.Staff.id).all()
+    return [r[0] for r in rows]
+
+
+def eligible_resources(db: Session, index: ResourceIndex, service_id: int = None):
+    """
+    Recursos que pueden hacer el servicio. Sin asignaciones, cualquiera puede.
+    Si todos los asignados están dados de baja devuelve [] y el servicio queda
+    sin turnos disponibles (no se reparte entre profesionales no asignados).
+    """
+    if index.resource_ids == [SINGLE_RESOURCE] or service_id is None:
+        return list(index.resource_ids)
+    mapped = {
+        r[0] for r in db.query(models.service_staff.c.staff_id).filter(
+            models.service_staff.c.service_id == service_id
+        ).all()
+    }
+    if not mapped:
+        return list(index.resource_ids)
+    return [rid for rid in index.resource_ids if rid in mapped]
+
+
+def load_resource_index(db: Session, owner_id: int, start: datetime, end: datetime, default_duration: int = DEFAULT_DURATION):
+    """
+    Arma el índice de un negocio para la ventana [inicio, fin) con una sola consulta
+    de turnos (más la de profesionales activos), sin consultas por profesional.
+    """
+    index = ResourceIndex(active_staff_ids(db, owner_id))
+    rows = db.query(
+        models.Appointment.date_time,
+        models.Appointment.staff_id,
+        models.Service.duration,
+    ).outerjoin(
+        models.Service, models.Appointment.service_id == models.Service.id
+    ).filter(
+        models.Appointment.owner_id == owner_id,
+        models.Appointment.date_time >= start - MAX_APPOINTMENT_SPAN,
+        models.Appointment.date_time < end,
+        or_(models.Appointment.status.is_(None), models.Appointment.status != "cancelled")
+    ).order_by(models.Appointment.date_time.asc()).all()
+    fill_index(index, rows, default_duration)
+    return index
+
+
+def fill_index(index: ResourceIndex, rows, default_duration: int = DEFAULT_DURATION):
+    """rows: (date_time, staff_id, duration) ordenadas por fecha."""
+    single = index.resource_ids == [SINGLE_RESOURCE]
+    unassigned = []
+    for date_time, staff_id, duration in rows:
+        apt_end = date_time + timedelta(minutes=duration or default_duration)
+        if single:
+            index.reserve(SINGLE_RESOURCE, date_time, apt_end)
+        elif staff_id is None:
+            unassigned.append((date_time, apt_end))
+        elif staff_id in index._busy:
+            index.reserve(staff_id, date_time, apt_end)
+        # Los turnos de profesionales dados de baja no ocupan a nadie
+
+    # Turnos previos a la carga de profesionales: ocupan al primero libre
+    for apt_start, apt_end in unassigned:
+        rid = index.find_free(index.resource_ids, apt_start, apt_end)
+        index.reserve(index.resource_ids[0] if rid is False else rid, apt_start, apt_end)
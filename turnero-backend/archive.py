@@ -0,0 +1,93 @@
+import json
+import zlib
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+import models
+
+# Formato del payload: JSON con una lista por columna, comprimido con zlib.
+# Guardar por columnas hace que valores repetidos (servicio, estado, precio)
+# queden juntos y comprimen mucho mejor que fila por fila.
+ARCHIVE_VERSION = 1
+ARCHIVE_COLUMNS = (
+    "id", "service_id", "service_name", "staff_id", "customer_id", "customer_name",
+    "customer_email", "customer_phone", "date_time", "price", "status",
+)
+
+# Las fechas se guardan como segundos desde EPOCH, sin zona horaria (igual que en la tabla)
+EPOCH = datetime(1970, 1, 1)
+
+# Cantidad de ids por DELETE al sacar turnos de la tabla viva
+DELETE_BATCH_SIZE = 500
+
+
+def encode_rows(rows) -> bytes:
+    """rows: lista de dicts con ARCHIVE_COLUMNS; date_time como datetime."""
+    columns = {name: [] for name in ARCHIVE_COLUMNS}
+    for row in rows:
+        for name in ARCHIVE_COLUMNS:
+            value = row.get(name)
+            if name == "date_time" and value is not None:
+                value = int((value - EPOCH).total_seconds())
+            columns[name].append(value)
+    body = json.dumps({"v": ARCHIVE_VERSION, "columns": columns}, separators=(",", ":"))
+    return zlib.compress(body.encode("utf-8"), 6)
+
+
+def decode_payload(payload: bytes) -> dict:
+    """Devuelve {columna: lista de valores} con date_time en segundos desde EPOCH."""
+    if not payload:
+        return {name: [] for name in ARCHIVE_COLUMNS}
+    return json.loads(zlib.decompress(payload))["columns"]
+
+
+def iter_rows(columns: dict):
+    names = [n for n in ARCHIVE_COLUMNS if n in columns]
+    for values in zip(*(columns[n] for n in names)):
+        row = dict(zip(names, values))
+        if row.get("date_time") is not None:
+            row["date_time"] = EPOCH + timedelta(seconds=row["date_time"])
+        yield row
+
+
+def store_month(db: Session, owner_id: int, date_code: str, rows):
+    """Agrega los turnos al archivo del mes, creándolo si no existe (no hace commit)."""
+    archive = db.query(models.AppointmentArchive).filter(
+        models.AppointmentArchive.owner_id == owner_id,
+        models.AppointmentArchive.date_code == date_code
+    ).first()
+    if archive:
+        # Un mes ya cerrado puede recibir turnos cargados tarde. No se repiten:
+        # los turnos salen de la tabla viva en la misma transacción.
+        rows = list(iter_rows(decode_payload(archive.payload))) + list(rows)
+    else:
+        archive = models.AppointmentArchive(owner_id=owner_id, date_code=date_code)
+        db.add(archive)
+
+    archive.payload = encode_rows(rows)
+    archive.row_count = len(rows)
+    return archive
+
+
+def delete_appointments(db: Session, ids):
+    """Borra los turnos ya archivados en lotes acotados de ids (no hace commit)."""
+    ids = list(ids)
+    for i in range(0, len(ids), DELETE_BATCH_SIZE):
+        db.query(models.Appointment).filter(
+            models.Appointment.id.in_(ids[i:i + DELETE_BATCH_SIZE])
+        ).delete(synchronize_session=False)
+
+
+def scan_archive(db: Session, owner_id: int, from_code: str = None, to_code: str = None):
+    """
+    Recorre los turnos archivados de un negocio entre dos meses ("YYYY-MM", inclusive),
+    sin tocar la tabla `appointments`. Devuelve (date_code, columnas) por mes.
+    """
+    query = db.query(
+        models.AppointmentArchive.date_code, models.AppointmentArchive.payload
+    ).filter(models.AppointmentArchive.owner_id == owner_id)
+    if from_code:
+        query = query.filter(models.AppointmentArchive.date_code >= from_code)
+    if to_code:
+        query = query.filter(models.AppointmentArchive.date_code <= to_code)
+    for date_code, payload in query.order_by(models.AppointmentArchive.date_code.asc()).yield_per(12):
+        yield date_code, decode_payload(payload)
@@ -0,0 +1,85 @@
+"""
+Microbenchmark de la búsqueda de clientes (find_customers) con 100k clientes.
+
+Mide consultas típicas mientras se escribe: una palabra, dos palabras comunes,
+una palabra común con otra que no existe, email y teléfono.
+
+Uso: python bench_customers.py [cantidad_de_clientes]
+"""
+import os
+import sys
+import random
+import time
+
+os.environ["DATABASE_URL"] = "sqlite://"
+
+import models
+from database import engine, SessionLocal
+from customers import find_customers, rebuild_terms
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+ROUNDS = 5
+# Objetivo por búsqueda (autocompletado mientras se escribe)
+TARGET_MS = 20
+
+FIRST_NAMES = (
+    "maria", "jose", "juan", "ana", "luis", "carlos", "laura", "marta", "pedro", "lucia",
+    "jorge", "sofia", "diego", "paula", "miguel", "elena", "pablo", "carmen", "andres", "valeria",
+    "martin", "camila", "facundo", "agustina", "nicolas", "florencia", "tomas", "julieta",
+)
+LAST_NAMES = (
+    "garcia", "gonzalez", "rodriguez", "fernandez", "lopez", "martinez", "sanchez", "perez",
+    "gomez", "diaz", "alvarez", "romero", "sosa", "torres", "ruiz", "ramirez", "flores",
+    "benitez", "acosta", "medina", "herrera", "suarez", "aguirre", "gimenez", "molina",
+)
+QUERIES = (
+    "maria", "gonz", "maria gonzalez", "maria zzz", "a b", "ma ga",
+    "zzz", "jose1", "1155", "11 5512",
+)
+
+
+def seed(db):
+    rnd = random.Random(1)
+    user = models.User(username="bench", hashed_password="x")
+    db.add(user)
+    db.flush()
+    customers = []
+    for i in range(N):
+        first, last = rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES)
+        email = f"{first}{i}@mail.com"
+        phone = f"11{i * 7919 % 10 ** 8:08d}"  # distintos y sin orden aparente
+        customers.append({
+            "owner_id": user.id, "name": f"{first.title()} {last.title()}",
+            "email": email, "email_norm": email, "phone": phone, "phone_norm": phone, "visits": 1,
+        })
+    db.bulk_insert_mappings(models.Customer, customers)
+    rebuild_terms(db, user.id)
+    db.commit()
+    return user.id
+
+
+def measure(owner_id, query):
+    best = float("inf")
+    found = 0
+    for _ in range(ROUNDS):
+        db = SessionLocal()
+        try:
+            t0 = time.perf_counter()
+            found = len(find_customers(db, owner_id, query))
+            best = min(best, time.perf_counter() - t0)
+        finally:
+            db.close()
+    return best, found
+
+
+if __name__ == "__main__":
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    owner_id = seed(db)
+    db.close()
+
+    print(f"{N} clientes (mejor de {ROUNDS}, objetivo {TARGET_MS} ms)")
+    for query in QUERIES:
+        elapsed, found = measure(owner_id, query)
+        mark = "" if elapsed * 1000 <= TARGET_MS else "  <- supera el objetivo"
+        print(f"  {query!r:18} {elapsed * 1000:7.1f} ms  {found:3d} resultados{mark}")
@@ -0,0 +1,108 @@
+"""
+Microbenchmark de serialización de GET /appointments con 10k turnos.
+
+Compara el camino anterior (objetos ORM + reflexión de columnas + jsonable_encoder
++ json estándar) con el actual (tuplas de columnas + response_model + orjson).
+
+Uso: python bench_serialization.py [cantidad_de_turnos]
+"""
+import os
+import sys
+import json
+import time
+from datetime import datetime, timedelta
+
+os.environ["DATABASE_URL"] = "sqlite://"
+# main.py las exige al importarse; el benchmark no emite tokens
+os.environ.setdefault("CLAVE", "bench")
+os.environ.setdefault("ALGORITMO", "HS256")
+os.environ.setdefault("TIEMPO", "30")
+
+import orjson
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+import models
+from database import engine, SessionLocal
+from schemas import AppointmentOut
+from main import APPOINTMENT_COLUMNS
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+ROUNDS = 5
+
+
+def seed(db):
+    user = models.User(username="bench", hashed_password="x")
+    db.add(user)
+    db.flush()
+    service = models.Service(owner_id=user.id, name="Corte", price=1000, duration=30)
+    db.add(service)
+    db.flush()
+    start = datetime(2030, 1, 1, 9, 0)
+    db.bulk_insert_mappings(models.Appointment, [
+        {
+            "owner_id": user.id, "service_id": service.id,
+            "customer_name": f"Cliente {i}", "customer_email": f"cliente{i}@mail.com",
+            "customer_phone": f"11{i:08d}", "date_time": start + timedelta(minutes=30 * i),
+            "price": 1000, "status": "pending",
+        }
+        for i in range(N)
+    ])
+    db.commit()
+    return user.id
+
+
+def legacy(db, owner_id):
+    results = db.query(
+        models.Appointment, models.Service.name.label("service_name")
+    ).join(
+        models.Service, models.Appointment.service_id == models.Service.id
+    ).filter(models.Appointment.owner_id == owner_id).order_by(models.Appointment.date_time.asc()).all()
+    appointments = []
+    for apt, s_name in results:
+        apt_dict = {column.name: getattr(apt, column.name) for column in apt.__table__.columns}
+        apt_dict["service_name"] = s_name
+        appointments.append(apt_dict)
+    return json.dumps(jsonable_encoder(appointments)).encode("utf-8")
+
+
+adapter = TypeAdapter(List[AppointmentOut])
+
+
+def typed(db, owner_id):
+    results = db.query(
+        *APPOINTMENT_COLUMNS,
+        models.Service.name.label("service_name")
+    ).join(
+        models.Service, models.Appointment.service_id == models.Service.id
+    ).filter(models.Appointment.owner_id == owner_id).order_by(models.Appointment.date_time.asc()).all()
+    # Mismo camino que FastAPI con response_model + ORJSONResponse
+    content = adapter.dump_python(adapter.validate_python([r._asdict() for r in results]), mode="json")
+    return orjson.dumps(content)
+
+
+def measure(fn, owner_id):
+    best = float("inf")
+    for _ in range(ROUNDS):
+        db = SessionLocal()
+        try:
+            t0 = time.perf_counter()
+            fn(db, owner_id)
+            best = min(best, time.perf_counter() - t0)
+        finally:
+            db.close()
+    return best
+
+
+if __name__ == "__main__":
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    owner_id = seed(db)
+    db.close()
+
+    t_legacy = measure(legacy, owner_id)
+    t_typed = measure(typed, owner_id)
+    print(f"{N} turnos (mejor de {ROUNDS})")
+    print(f"  ORM + jsonable_encoder + json: {t_legacy * 1000:8.1f} ms")
+    print(f"  columnas + pydantic + orjson:  {t_typed * 1000:8.1f} ms")
+    print(f"  mejora: {t_legacy / t_typed:.1f}x")
@@ -0,0 +1,37 @@
+"""
+Mide el tiempo desde que arranca un worker hasta que la app está lista
+(importar main.py y construir la app), en procesos nuevos para no reutilizar caché.
+
+Uso: python bench_startup.py [repeticiones]
+Sale con código 1 si la mediana supera STARTUP_TARGET_MS (1500 ms por defecto).
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+TARGET_MS = float(os.getenv("STARTUP_TARGET_MS", "1500"))
+RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+PROBE = (
+    "import time; t0 = time.perf_counter(); "
+    "import main; assert main.app.routes; "
+    "print((time.perf_counter() - t0) * 1000)"
+)
+
+
+def measure_once():
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True,
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    samples = [measure_once() for _ in range(RUNS)]
+    median = statistics.median(samples)
+    print(f"import-to-ready ({RUNS} procesos): mediana {median:.0f} ms, "
+          f"mín {min(samples):.0f} ms, máx {max(samples):.0f} ms (objetivo {TARGET_MS:.0f} ms)")
+    sys.exit(0 if median <= TARGET_MS else 1)
@@ -0,0 +1,191 @@
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+import models
+
+# Ventana móvil que cubre el feed
+CALENDAR_DAYS_BACK = 30
+CALENDAR_DAYS_AHEAD = 180
+# Segundos que un feed armado se sirve sin volver a la base. Los cambios hechos
+# desde este worker lo invalidan al instante; los de otros workers, al vencer.
+CALENDAR_CACHE_TTL = 300
+
+DEFAULT_DURATION = 30
+
+
+def _escape(value) -> str:
+    value = str(value or "")
+    return (
+        value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    # RFC 5545: líneas de hasta 75 octetos, continuadas con un espacio
+    raw = line.encode("utf-8")
+    if len(raw) <= 75:
+        return line
+    parts = []
+    while raw:
+        size = 75 if not parts else 74
+        chunk = raw[:size]
+        # No cortar un carácter UTF-8 a la mitad
+        while chunk and (raw[len(chunk):len(chunk) + 1] or b"\x00")[0] & 0xC0 == 0x80:
+            chunk = chunk[:-1]
+        parts.append(chunk.decode("utf-8"))
+        raw = raw[len(chunk):]
+    return "\r\n ".join(parts)
+
+
+def _ics_datetime(value: datetime) -> str:
+    # Hora local "flotante", igual que se guarda en la tabla
+    return value.strftime("%Y%m%dT%H%M%S")
+
+
+def render_event(row, stamp: str) -> str:
+    start = row.date_time
+    end = start + timedelta(minutes=row.duration or DEFAULT_DURATION)
+    summary = f"{row.service_name or 'Turno'} - {row.customer_name or ''}".strip(" -")
+    details = [f"Cliente: {row.customer_name or ''}"]
+    if row.customer_phone:
+        details.append(f"Teléfono: {row.customer_phone}")
+    if row.customer_email:
+        details.append(f"Email: {row.customer_email}")
+    if row.staff_name:
+        details.append(f"Profesional: {row.staff_name}")
+    details.append(f"Estado: {row.status}")
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:turno-{row.id}@turnero",
+        f"DTSTAMP:{stamp}",
+        f"DTSTART:{_ics_datetime(start)}",
+        f"DTEND:{_ics_datetime(end)}",
+        f"SUMMARY:{_escape(summary)}",
+        f"DESCRIPTION:{_escape(chr(10).join(details))}",
+        f"STATUS:{'TENTATIVE' if row.status == 'pending' else 'CONFIRMED'}",
+        "END:VEVENT",
+    ]
+    return "\r\n".join(_fold(line) for line in lines)
+
+
+class CachedFeed:
+    __slots__ = ("body", "etag", "built_at", "window_day", "stale", "events")
+
+    def __init__(self, body: bytes, events: dict, window_day):
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self.built_at = time.monotonic()
+        self.window_day = window_day
+        self.stale = False
+        self.events = events  # id del turno -> (huella de la fila, texto del VEVENT)
+
+    def is_fresh(self) -> bool:
+        return (
+            not self.stale
+            and self.window_day == datetime.now().date()
+            and time.monotonic() - self.built_at < CALENDAR_CACHE_TTL
+        )
+
+
+_feeds = {}
+_tokens = {}  # token -> (owner_id, vence); se vuelve a validar contra la base al vencer
+_lock = threading.Lock()
+
+
+def owner_for_token(db: Session, token: str):
+    """
+    Resuelve el token al owner_id. El resultado se recuerda CALENDAR_CACHE_TTL
+    segundos, así un token rotado o un negocio suspendido desde otro worker
+    deja de funcionar en este a lo sumo en ese tiempo.
+    """
+    cached = _tokens.get(token)
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+    row = db.query(models.Profile.owner_id).join(
+        models.User, models.Profile.owner_id == models.User.id
+    ).filter(
+        models.Profile.calendar_token == token,
+        models.User.is_active == True
+    ).first()
+    with _lock:
+        if not row:
+            _tokens.pop(token, None)
+            return None
+        _tokens[token] = (row.owner_id, time.monotonic() + CALENDAR_CACHE_TTL)
+    return row.owner_id
+
+
+def cached_feed(owner_id: int):
+    feed = _feeds.get(owner_id)
+    return feed if feed is not None and feed.is_fresh() else None
+
+
+def build_feed(db: Session, owner_id: int) -> CachedFeed:
+    """
+    Arma el feed del negocio. Los VEVENT de turnos que no cambiaron desde
+    la versión anterior se reutilizan en lugar de volver a renderizarse.
+    """
+    today = datetime.now().date()
+    window_start = datetime.combine(today - timedelta(days=CALENDAR_DAYS_BACK), datetime.min.time())
+    window_end = datetime.combine(today + timedelta(days=CALENDAR_DAYS_AHEAD), datetime.min.time())
+
+    rows = db.query(
+        models.Appointment.id, models.Appointment.date_time, models.Appointment.status,
+        models.Appointment.customer_name, models.Appointment.customer_email,
+        models.Appointment.customer_phone,
+        models.Service.name.label("service_name"), models.Service.duration,
+        models.Staff.name.label("staff_name"),
+    ).outerjoin(
+        models.Service, models.Appointment.service_id == models.Service.id
+    ).outerjoin(
+        models.Staff, models.Appointment.staff_id == models.Staff.id
+    ).filter(
+        models.Appointment.owner_id == owner_id,
+        models.Appointment.date_time >= window_start,
+        models.Appointment.date_time < window_end,
+        or_(models.Appointment.status.is_(None), models.Appointment.status != "cancelled")
+    ).order_by(models.Appointment.date_time.asc()).all()
+    business = db.query(models.Profile.name).filter(models.Profile.owner_id == owner_id).first()
+
+    previous = _feeds.get(owner_id)
+    previous_events = previous.events if previous else {}
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    events = {}
+    for row in rows:
+        fingerprint = tuple(row)
+        cached = previous_events.get(row.id)
+        if cached and cached[0] == fingerprint:
+            events[row.id] = cached
+        else:
+            events[row.id] = (fingerprint, render_event(row, stamp))
+
+    header = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//Turnero//Agenda//ES",
+        "CALSCALE:GREGORIAN",
+        _fold(f"X-WR-CALNAME:{_escape(business.name if business else 'Turnos')}"),
+    ]
+    body = "\r\n".join(header + [text for _, text in events.values()] + ["END:VCALENDAR", ""])
+    feed = CachedFeed(body.encode("utf-8"), events, today)
+    with _lock:
+        _feeds[owner_id] = feed
+    return feed
+
+
+def invalidate_calendar(owner_id: int):
+    """Marca el feed como desactualizado; se conserva para reutilizar sus eventos."""
+    feed = _feeds.get(owner_id)
+    if feed is not None:
+        feed.stale = True
+
+
+def forget_calendar(owner_id: int):
+    """Descarta el feed y los tokens del negocio (ej. al rotar el token)."""
+    with _lock:
+        _feeds.pop(owner_id, None)
+        for token in [t for t, (o, _) in _tokens.items() if o == owner_id]:
+            _tokens.pop(token, None)
@@ -0,0 +1,292 @@
+import re
+import unicodedata
+from datetime import datetime
+from sqlalchemy import func, or_, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import models
+import archive
+
+_WORD_RE = re.compile(r"[a-z0-9@._+-]+")
+
+
+def normalize_text(value: str) -> str:
+    if not value:
+        return ""
+    value = unicodedata.normalize("NFKD", value)
+    return "".join(c for c in value if not unicodedata.combining(c)).lower().strip()
+
+
+def normalize_email(value: str):
+    value = (value or "").strip().lower()
+    return value or None
+
+
+def normalize_phone(value: str):
+    digits = re.sub(r"\D", "", value or "")
+    return digits or None
+
+
+def customer_terms(name, email, phone):
+    """Términos por los que se encuentra a un cliente: palabras del nombre, email y teléfono."""
+    terms = set(_WORD_RE.findall(normalize_text(name)))
+    email_norm = normalize_email(email)
+    if email_norm:
+        terms.add(email_norm)
+    phone_norm = normalize_phone(phone)
+    if phone_norm:
+        terms.add(phone_norm)
+    return terms
+
+
+def sync_terms(db: Session, customer: models.Customer):
+    """Reemplaza los términos de búsqueda del cliente (no hace commit)."""
+    db.query(models.CustomerTerm).filter(
+        models.CustomerTerm.customer_id == customer.id
+    ).delete(synchronize_session=False)
+    db.bulk_insert_mappings(models.CustomerTerm, [
+        {"owner_id": customer.owner_id, "customer_id": customer.id, "term": term}
+        for term in customer_terms(customer.name, customer.email, customer.phone)
+    ])
+
+
+CUSTOMER_COLUMNS = (
+    models.Customer.id, models.Customer.name, models.Customer.email, models.Customer.phone,
+    models.Customer.visits, models.Customer.last_seen_at,
+)
+
+# Hasta cuántas filas se cuenta cada rango para elegir el término más
+# selectivo; más allá de esto todos los rangos se consideran igual de grandes.
+TERM_COUNT_LIMIT = 5000
+# Filas del rango elegido que se leen y filtran por tanda
+TERM_BATCH_SIZE = 200
+
+
+def _prefix_range(column, prefix: str):
+    # Rango en lugar de LIKE: usa el índice (owner_id, term) en cualquier base
+    return column >= prefix, column < prefix + "\uffff"
+
+
+def _range_size(db: Session, owner_id: int, prefix: str) -> int:
+    term = models.CustomerTerm
+    rows = db.query(term.id).filter(
+        term.owner_id == owner_id, *_prefix_range(term.term, prefix)
+    ).limit(TERM_COUNT_LIMIT).subquery()
+    return db.query(func.count()).select_from(rows).scalar()
+
+
+def _scan_range(db: Session, owner_id: int, prefix: str, after=None):
+    """Siguiente tanda del rango del prefijo, en orden de término: (term, id, customer_id)."""
+    term = models.CustomerTerm
+    query = db.query(term.term, term.id, term.customer_id).filter(
+        term.owner_id == owner_id, *_prefix_range(term.term, prefix)
+    )
+    if after is not None:
+        query = query.filter(tuple_(term.term, term.id) > tuple_(*after))
+    return query.order_by(term.term, term.id).limit(TERM_BATCH_SIZE).all()
+
+
+def _matching(db: Session, candidates, prefixes):
+    """Los candidatos (en orden) que tienen algún término con cada uno de los prefijos."""
+    if not prefixes:
+        return candidates
+    terms_of = {}
+    for customer_id, value in db.query(
+        models.CustomerTerm.customer_id, models.CustomerTerm.term
+    ).filter(models.CustomerTerm.customer_id.in_(candidates)):
+        terms_of.setdefault(customer_id, []).append(value)
+    return [
+        cid for cid in candidates
+        if all(any(value.startswith(prefix) for value in terms_of.get(cid, ())) for prefix in prefixes)
+    ]
+
+
+def find_customers(db: Session, owner_id: int, query: str, limit: int = 10):
+    """
+    Busca clientes por prefijo de palabras del nombre, email o teléfono; todos
+    los términos del texto tienen que coincidir. Se cuenta (con tope) el rango
+    de cada término en el índice: si alguno está vacío no hay resultados, y si
+    no se recorre por tandas el más chico, filtrando los candidatos por el
+    resto de los términos a partir de sus propios términos.
+    """
+    terms = _WORD_RE.findall(normalize_text(query))
+    # Un teléfono escrito con espacios o guiones se busca como un solo número
+    digits = normalize_phone(query)
+    if digits and len(terms) > 1 and all(t.isdigit() for t in terms):
+        terms = [digits]
+    if not terms:
+        return []
+
+    prefixes = list(dict.fromkeys(terms))
+    if len(prefixes) > 1:
+        sizes = {}
+        for prefix in prefixes:
+            sizes[prefix] = _range_size(db, owner_id, prefix)
+            if not sizes[prefix]:
+                return []
+        # El rango más chico; a igual tamaño, el término más largo
+        prefixes.sort(key=lambda p: (sizes[p], -len(p)))
+    prefix, others = prefixes[0], prefixes[1:]
+
+    ids = []
+    seen = set()
+    rows = _scan_range(db, owner_id, prefix)
+    while rows:
+        candidates = []
+        for _, _, customer_id in rows:
+            if customer_id not in seen:
+                seen.add(customer_id)
+                candidates.append(customer_id)
+        ids.extend(_matching(db, candidates, others))
+        if len(ids) >= limit or len(rows) < TERM_BATCH_SIZE:
+            break
+        rows = _scan_range(db, owner_id, prefix, after=rows[-1][:2])
+    ids = ids[:limit]
+    if not ids:
+        return []
+    rows = {r.id: r._asdict() for r in db.query(*CUSTOMER_COLUMNS).filter(models.Customer.id.in_(ids))}
+    return [rows[cid] for cid in ids if cid in rows]
+
+
+def _find_customer(db: Session, owner_id: int, email_norm, phone_norm):
+    conditions = []
+    if email_norm:
+        conditions.append(models.Customer.email_norm == email_norm)
+    if phone_norm:
+        conditions.append(models.Customer.phone_norm == phone_norm)
+    return db.query(models.Customer).filter(
+        models.Customer.owner_id == owner_id, or_(*conditions)
+    ).order_by(models.Customer.id).first()
+
+
+def upsert_customer(db: Session, owner_id: int, name: str, email: str = None, phone: str = None, seen_at: datetime = None):
+    """
+    Busca el cliente por email o teléfono normalizado y lo crea si no existe.
+    Sin email ni teléfono no hay forma de deduplicar y devuelve None. No hace commit.
+    """
+    email_norm = normalize_email(email)
+    phone_norm = normalize_phone(phone)
+    if not email_norm and not phone_norm:
+        return None
+    seen_at = seen_at or datetime.now()
+
+    customer = _find_customer(db, owner_id, email_norm, phone_norm)
+    known_terms = customer_terms(customer.name, customer.email, customer.phone) if customer else None
+    if customer is None:
+        try:
+            with db.begin_nested():
+                customer = models.Customer(
+                    owner_id=owner_id, name=name, email=email, phone=phone,
+                    email_norm=email_norm, phone_norm=phone_norm,
+                    visits=1, first_seen_at=seen_at, last_seen_at=seen_at
+                )
+                db.add(customer)
+        except IntegrityError:
+            # Otra reserva creó el mismo cliente al mismo tiempo
+            customer = _find_customer(db, owner_id, email_norm, phone_norm)
+            customer.visits = (customer.visits or 0) + 1
+            known_terms = None
+    else:
+        customer.visits = (customer.visits or 0) + 1
+        customer.name = name or customer.name
+        customer.last_seen_at = max(customer.last_seen_at or seen_at, seen_at)
+        # Completar datos de contacto nuevos si no pertenecen a otro cliente
+        if email_norm and not customer.email_norm and not _find_customer(db, owner_id, email_norm, None):
+            customer.email, customer.email_norm = email, email_norm
+        if phone_norm and not customer.phone_norm and not _find_customer(db, owner_id, None, phone_norm):
+            customer.phone, customer.phone_norm = phone, phone_norm
+
+    db.flush()
+    # Los términos van en la misma transacción que el cliente: si la reserva
+    # se revierte, la búsqueda tampoco lo encuentra
+    if customer_terms(customer.name, customer.email, customer.phone) != known_terms:
+        sync_terms(db, customer)
+    return customer
+
+
+def backfill_customers(db: Session, owner_id: int):
+    """
+    Arma el directorio de un negocio a partir de los turnos vivos y del archivo,
+    en memoria y con escrituras en bloque. Recalcula visitas y fechas desde cero,
+    así que se puede correr más de una vez. Hace commit.
+    """
+    records = []
+    by_email = {}
+    by_phone = {}
+    for customer in db.query(models.Customer).filter(models.Customer.owner_id == owner_id):
+        record = {"obj": customer, "visits": 0, "first": None, "last": None}
+        records.append(record)
+        if customer.email_norm:
+            by_email[customer.email_norm] = record
+        if customer.phone_norm:
+            by_phone[customer.phone_norm] = record
+
+    links = []
+
+    def feed(name, email, phone, seen_at, appointment_id=None):
+        email_norm = normalize_email(email)
+        phone_norm = normalize_phone(phone)
+        if not email_norm and not phone_norm:
+            return
+        record = (email_norm and by_email.get(email_norm)) or (phone_norm and by_phone.get(phone_norm))
+        if record is None:
+            record = {
+                "obj": models.Customer(owner_id=owner_id, name=name),
+                "visits": 0, "first": None, "last": None,
+            }
+            records.append(record)
+        customer = record["obj"]
+        if email_norm and not customer.email_norm and email_norm not in by_email:
+            customer.email, customer.email_norm = email, email_norm
+            by_email[email_norm] = record
+        if phone_norm and not customer.phone_norm and phone_norm not in by_phone:
+            customer.phone, customer.phone_norm = phone, phone_norm
+            by_phone[phone_norm] = record
+        record["visits"] += 1
+        if seen_at:
+            record["first"] = min(record["first"] or seen_at, seen_at)
+            if record["last"] is None or seen_at >= record["last"]:
+                record["last"] = seen_at
+                customer.name = name or customer.name
+        if appointment_id is not None:
+            links.append((appointment_id, record))
+
+    for _, columns in archive.scan_archive(db, owner_id):
+        for row in archive.iter_rows(columns):
+            feed(row["customer_name"], row["customer_email"], row["customer_phone"], row["date_time"])
+    live = db.query(
+        models.Appointment.id, models.Appointment.customer_name, models.Appointment.customer_email,
+        models.Appointment.customer_phone, models.Appointment.date_time
+    ).filter(models.Appointment.owner_id == owner_id).order_by(models.Appointment.date_time.asc()).all()
+    for apt_id, name, email, phone, date_time in live:
+        feed(name, email, phone, date_time, apt_id)
+
+    for record in records:
+        customer = record["obj"]
+        customer.visits = record["visits"]
+        customer.first_seen_at = record["first"] or customer.first_seen_at
+        customer.last_seen_at = record["last"] or customer.last_seen_at
+    db.add_all(r["obj"] for r in records)
+    db.flush()  # asigna ids a los clientes nuevos en un solo lote
+
+    db.bulk_update_mappings(models.Appointment, [
+        {"id": apt_id, "customer_id": record["obj"].id} for apt_id, record in links
+    ])
+    rebuild_terms(db, owner_id)
+    db.commit()
+    return len(records)
+
+
+def rebuild_terms(db: Session, owner_id: int):
+    """Vuelve a generar todos los términos de búsqueda del negocio (no hace commit)."""
+    db.query(models.CustomerTerm).filter(
+        models.CustomerTerm.owner_id == owner_id
+    ).delete(synchronize_session=False)
+    rows = db.query(
+        models.Customer.id, models.Customer.name, models.Customer.email, models.Customer.phone
+    ).filter(models.Customer.owner_id == owner_id).all()
+    db.bulk_insert_mappings(models.CustomerTerm, [
+        {"owner_id": owner_id, "customer_id": cid, "term": term}
+        for cid, name, email, phone in rows
+        for term in customer_terms(name, email, phone)
+    ])
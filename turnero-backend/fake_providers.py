@@ -0,0 +1,167 @@
+"""
+Servidor HTTP falso que imita las rutas de Brevo y de Supabase Storage que usa
+el backend, con latencia y errores configurables. Sirve para probar los
+timeouts, el bulkhead y los circuit breakers de integrations.py sin tocar los
+servicios reales: a mano o desde tests/test_integrations.py.
+
+Uso:
+    python fake_providers.py --port 8099 --latency 3 --error-rate 0.5
+
+y levantar la app con:
+    SUPABASE_URL=http://127.0.0.1:8099 SUPABASE_KEY=fake
+    BREVO_API_KEY=fake BREVO_API_HOST=http://127.0.0.1:8099/v3
+
+La configuración se cambia en caliente con
+    curl -X POST 'http://127.0.0.1:8099/__fake__/config?latency=0&error_rate=0'
+y GET /__fake__/stats devuelve cuántas llamadas recibió cada ruta.
+
+También se puede usar desde Python:
+    with FakeProviderServer(latency=2) as server:
+        ...  # server.url
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class FakeConfig:
+    def __init__(self, latency: float = 0, error_rate: float = 0, error_status: int = 503):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.hits = Counter()
+        self.lock = threading.Lock()
+
+    def update(self, values: dict):
+        with self.lock:
+            if "latency" in values:
+                self.latency = float(values["latency"])
+            if "error_rate" in values:
+                self.error_rate = float(values["error_rate"])
+            if "error_status" in values:
+                self.error_status = int(values["error_status"])
+
+    def as_dict(self):
+        return {"latency": self.latency, "error_rate": self.error_rate, "error_status": self.error_status}
+
+
+def _route(path: str) -> str:
+    if path.startswith("/v3/smtp/email"):
+        return "brevo.send_transac_email"
+    if path.startswith("/storage/v1/object/"):
+        return "supabase.storage"
+    return "other"
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    config: FakeConfig = None
+
+    def log_message(self, format, *args):
+        pass  # sin ruido en la consola
+
+    def _send_json(self, status: int, body: dict):
+        raw = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        try:
+            self.wfile.write(raw)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # el cliente ya se cansó de esperar
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _handle(self):
+        url = urlparse(self.path)
+        self._read_body()
+        config = self.config
+
+        if url.path == "/__fake__/config":
+            if self.command == "POST":
+                config.update({k: v[0] for k, v in parse_qs(url.query).items()})
+            return self._send_json(200, config.as_dict())
+        if url.path == "/__fake__/stats":
+            return self._send_json(200, dict(config.hits))
+
+        route = _route(url.path)
+        with config.lock:
+            config.hits[route] += 1
+            latency, error_rate, error_status = config.latency, config.error_rate, config.error_status
+        if latency:
+            time.sleep(latency)
+        if error_rate and random.random() < error_rate:
+            # Campos de error de Brevo (code) y de Supabase Storage (statusCode, error)
+            return self._send_json(error_status, {
+                "code": "fake_error", "statusCode": str(error_status), "error": "fake_error",
+                "message": "Error inyectado",
+            })
+
+        if route == "brevo.send_transac_email":
+            return self._send_json(201, {"messageId": f"<{uuid.uuid4()}@fake>"})
+        if route == "supabase.storage":
+            key = url.path[len("/storage/v1/object/"):]
+            return self._send_json(200, {"Key": key, "Id": str(uuid.uuid4())})
+        return self._send_json(200, {})
+
+    do_GET = _handle
+    do_POST = _handle
+    do_PUT = _handle
+    do_DELETE = _handle
+
+
+class FakeProviderServer:
+    """Levanta el servidor falso en un thread; `url` es la base para las variables de entorno."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **config):
+        self.config = FakeConfig(**config)
+        handler = type("Handler", (FakeProviderHandler,), {"config": self.config})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Brevo y Supabase Storage falsos")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0, help="segundos de demora por respuesta")
+    parser.add_argument("--error-rate", type=float, default=0, help="proporción de respuestas con error (0 a 1)")
+    parser.add_argument("--error-status", type=int, default=503)
+    args = parser.parse_args()
+
+    server = FakeProviderServer(
+        args.host, args.port,
+        latency=args.latency, error_rate=args.error_rate, error_status=args.error_status,
+    )
+    print(f"Proveedores falsos escuchando en {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
@@ -0,0 +1,254 @@
+"""
+Claves de idempotencia para POST /appointments.
+
+El backend por defecto guarda las claves en la tabla `idempotency_keys`, así un
+reintento que llega a otro worker de gunicorn encuentra la respuesta original.
+InMemoryIdempotencyStore guarda las claves en memoria del proceso: solo sirve
+con un único worker (desarrollo, pruebas) y se elige con IDEMPOTENCY_STORE=memory.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+import models
+from database import SessionLocal
+
+# Cuánto tiempo se recuerda la respuesta de una clave (segundos)
+IDEMPOTENCY_TTL = 24 * 60 * 60
+# Tope de claves en memoria por worker; al superarlo se descartan las más viejas
+IDEMPOTENCY_MAX_ENTRIES = 10_000
+# Cuánto espera un reintento a que termine el intento original (segundos)
+IDEMPOTENCY_WAIT_TIMEOUT = 15
+# Una clave en curso sin respuesta después de esto se da por abandonada (ej. el
+# worker murió a mitad de la reserva) y otro intento puede tomarla (segundos)
+IDEMPOTENCY_PENDING_TTL = 5 * 60
+# Cada cuánto consulta la base un reintento que espera al intento original (segundos)
+IDEMPOTENCY_POLL_INTERVAL = 0.1
+# Cada cuánto cada worker borra de la tabla las claves vencidas (segundos)
+IDEMPOTENCY_CLEANUP_INTERVAL = 10 * 60
+
+
+class IdempotencyConflict(Exception):
+    """La clave ya se usó con otros parámetros."""
+
+
+class IdempotencyInProgress(Exception):
+    """El intento original sigue en curso y no terminó dentro del tiempo de espera."""
+
+
+class StoredResponse:
+    __slots__ = ("status_code", "body")
+
+    def __init__(self, status_code: int, body):
+        self.status_code = status_code
+        self.body = body
+
+
+def fingerprint(*values) -> str:
+    """Huella de los parámetros de la request, para detectar claves reutilizadas."""
+    raw = json.dumps(values, default=str, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore(ABC):
+    """
+    Interfaz del almacenamiento de claves. Otro backend compartido entre
+    workers (ej. Redis) implementa estos tres métodos y se registra con
+    set_idempotency_store().
+    """
+
+    @abstractmethod
+    def reserve(self, key: str, request_fingerprint: str):
+        """
+        Devuelve la StoredResponse si la clave ya tiene respuesta, o None si este
+        llamado queda a cargo de ejecutar la operación. Si otro llamado con la misma
+        clave está en curso, espera a que termine.
+        """
+
+    @abstractmethod
+    def complete(self, key: str, status_code: int, body):
+        """Guarda la respuesta del intento original para repetirla en los reintentos."""
+
+    @abstractmethod
+    def release(self, key: str):
+        """El intento falló sin una respuesta que valga la pena repetir."""
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "expires_at", "done", "response")
+
+    def __init__(self, request_fingerprint: str, expires_at: float):
+        self.fingerprint = request_fingerprint
+        self.expires_at = expires_at
+        self.done = threading.Event()
+        self.response = None
+
+
+class InMemoryIdempotencyStore(IdempotencyStore):
+    """
+    Claves en memoria del proceso, con vencimiento por TTL y tope de tamaño.
+    Cada worker tiene las suyas: con más de un worker un reintento que cae en
+    otro proceso vuelve a reservar.
+    """
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL, max_entries: int = IDEMPOTENCY_MAX_ENTRIES,
+                 wait_timeout: float = IDEMPOTENCY_WAIT_TIMEOUT):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.wait_timeout = wait_timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float):
+        # El TTL es fijo, así que el orden de inserción es también el de vencimiento
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            if not entry.done.is_set() and entry.expires_at > now:
+                break  # no se descarta una clave en curso
+            self._entries.popitem(last=False)
+
+    def reserve(self, key: str, request_fingerprint: str):
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = _Entry(request_fingerprint, now + self.ttl)
+                return None
+        if entry.fingerprint != request_fingerprint:
+            raise IdempotencyConflict(key)
+        if not entry.done.wait(self.wait_timeout):
+            raise IdempotencyInProgress(key)
+        if entry.response is None:
+            # El intento original se liberó sin respuesta: este llamado lo reintenta
+            return self.reserve(key, request_fingerprint)
+        return entry.response
+
+    def complete(self, key: str, status_code: int, body):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            entry.response = StoredResponse(status_code, body)
+            entry.done.set()
+
+    def release(self, key: str):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry.done.set()
+
+
+class DatabaseIdempotencyStore(IdempotencyStore):
+    """
+    Claves en la tabla `idempotency_keys`, compartidas por todos los workers.
+    La clave primaria decide quién ejecuta: el primer INSERT gana y el resto
+    espera la respuesta consultando la fila. Usa sesiones propias y confirma
+    cada paso al instante, independiente de la transacción del request.
+    """
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL, pending_ttl: float = IDEMPOTENCY_PENDING_TTL,
+                 wait_timeout: float = IDEMPOTENCY_WAIT_TIMEOUT):
+        self.ttl = ttl
+        self.pending_ttl = pending_ttl
+        self.wait_timeout = wait_timeout
+        self._last_cleanup = 0.0
+
+    def _cleanup(self, db):
+        now = time.monotonic()
+        if now - self._last_cleanup < IDEMPOTENCY_CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
+        db.query(models.IdempotencyKey).filter(
+            models.IdempotencyKey.expires_at < datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.commit()
+
+    def reserve(self, key: str, request_fingerprint: str):
+        deadline = time.monotonic() + self.wait_timeout
+        db = SessionLocal()
+        try:
+            self._cleanup(db)
+            while True:
+                now = datetime.utcnow()
+                try:
+                    db.add(models.IdempotencyKey(
+                        key=key, fingerprint=request_fingerprint,
+                        expires_at=now + timedelta(seconds=self.pending_ttl)
+                    ))
+                    db.commit()
+                    return None
+                except IntegrityError:
+                    db.rollback()
+
+                row = db.query(
+                    models.IdempotencyKey.fingerprint, models.IdempotencyKey.status_code,
+                    models.IdempotencyKey.body, models.IdempotencyKey.expires_at
+                ).filter(models.IdempotencyKey.key == key).first()
+                db.commit()
+                if row is None:
+                    continue  # el intento original se liberó: se vuelve a intentar el INSERT
+                if row.expires_at < now:
+                    # Vencida o abandonada: se borra solo si nadie la tomó mientras tanto
+                    db.query(models.IdempotencyKey).filter(
+                        models.IdempotencyKey.key == key,
+                        models.IdempotencyKey.expires_at == row.expires_at
+                    ).delete(synchronize_session=False)
+                    db.commit()
+                    continue
+                if row.fingerprint != request_fingerprint:
+                    raise IdempotencyConflict(key)
+                if row.status_code is not None:
+                    return StoredResponse(row.status_code, json.loads(row.body))
+                if time.monotonic() >= deadline:
+                    raise IdempotencyInProgress(key)
+                time.sleep(IDEMPOTENCY_POLL_INTERVAL)
+        finally:
+            db.close()
+
+    def complete(self, key: str, status_code: int, body):
+        db = SessionLocal()
+        try:
+            db.query(models.IdempotencyKey).filter(models.IdempotencyKey.key == key).update({
+                "status_code": status_code,
+                "body": json.dumps(body, default=str, separators=(",", ":")),
+                "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl),
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def release(self, key: str):
+        db = SessionLocal()
+        try:
+            db.query(models.IdempotencyKey).filter(
+                models.IdempotencyKey.key == key,
+                models.IdempotencyKey.status_code.is_(None)
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+
+def _default_store() -> IdempotencyStore:
+    if os.getenv("IDEMPOTENCY_STORE", "database").lower() == "memory":
+        return InMemoryIdempotencyStore()
+    return DatabaseIdempotencyStore()
+
+
+_store: IdempotencyStore = _default_store()
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    return _store
+
+
+def set_idempotency_store(store: IdempotencyStore):
+    global _store
+    _store = store
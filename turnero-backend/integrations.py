@@ -0,0 +1,226 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+# Estados del circuit breaker
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class IntegrationError(Exception):
+    """Base de los errores del proveedor que la app puede traducir a 503."""
+
+    def __init__(self, provider: str, message: str):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+
+
+class CircuitOpenError(IntegrationError):
+    """El circuito está abierto: se rechaza sin llamar al proveedor."""
+
+
+class BulkheadFullError(IntegrationError):
+    """Todas las llamadas permitidas al proveedor están en curso."""
+
+
+class ProviderTimeoutError(IntegrationError):
+    """El proveedor no respondió dentro del tiempo de la llamada."""
+
+
+class CircuitBreaker:
+    """
+    Se abre tras `failure_threshold` fallas seguidas y rechaza las llamadas durante
+    `reset_timeout` segundos. Después deja pasar una sola llamada de prueba
+    (half-open): si sale bien se cierra, si falla vuelve a abrirse.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = HALF_OPEN
+                self._trial_in_flight = False
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        # La llamada de prueba terminó sin decir nada del proveedor (ej. error 4xx)
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class Provider:
+    """
+    Cliente de un servicio externo con tres protecciones:
+    - timeout por llamada: el request deja de esperar aunque el SDK siga bloqueado;
+    - bulkhead: a lo sumo `max_concurrent` llamadas en curso (incluidas las que
+      vencieron y siguen corriendo), así un proveedor lento no acapara los threads
+      de los requests;
+    - circuit breaker: con el proveedor caído se falla al instante.
+
+    `is_failure(exc)` decide qué excepciones cuentan para el breaker; los errores
+    del lado del cliente (ej. un email inválido) no deberían abrir el circuito.
+    """
+
+    def __init__(self, name: str, timeout: float = 10, max_concurrent: int = 4,
+                 queue_timeout: float = 0.5, failure_threshold: int = 5,
+                 reset_timeout: float = 30, is_failure=None):
+        self.name = name
+        self.timeout = timeout
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.is_failure = is_failure or (lambda exc: True)
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix=f"{name}-call")
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.metrics = {
+            "calls": 0, "successes": 0, "failures": 0, "timeouts": 0,
+            "rejected": 0, "short_circuited": 0,
+        }
+        self.last_error = None
+        self.last_latency_ms = None
+
+    def _count(self, metric: str, delta: int = 1):
+        with self._lock:
+            self.metrics[metric] += delta
+
+    def _finished(self, _future):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def call(self, fn, *args, timeout: float = None, **kwargs):
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            raise CircuitOpenError(self.name, "circuito abierto")
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self.breaker.release_trial()
+            self._count("rejected")
+            raise BulkheadFullError(self.name, "demasiadas llamadas en curso")
+
+        with self._lock:
+            self.in_flight += 1
+            self.metrics["calls"] += 1
+        started = time.monotonic()
+        future = self._executor.submit(fn, *args, **kwargs)
+        # El lugar se libera cuando la llamada termina de verdad, no cuando vence
+        future.add_done_callback(self._finished)
+        try:
+            result = future.result(timeout=timeout or self.timeout)
+        except FutureTimeout:
+            self._count("timeouts")
+            self.last_error = f"timeout tras {timeout or self.timeout}s"
+            self.breaker.record_failure()
+            raise ProviderTimeoutError(self.name, self.last_error)
+        except Exception as e:
+            if self.is_failure(e):
+                self._count("failures")
+                self.last_error = repr(e)
+                self.breaker.record_failure()
+            else:
+                self.breaker.release_trial()
+            raise
+        finally:
+            self.last_latency_ms = round((time.monotonic() - started) * 1000, 1)
+        self._count("successes")
+        self.breaker.record_success()
+        return result
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            data = dict(self.metrics)
+            data["in_flight"] = self.in_flight
+        data.update(
+            name=self.name,
+            state=self.breaker.state,
+            consecutive_failures=self.breaker.consecutive_failures,
+            max_concurrent=self.max_concurrent,
+            timeout=self.timeout,
+            last_error=self.last_error,
+            last_latency_ms=self.last_latency_ms,
+        )
+        return data
+
+
+def http_status(exc):
+    """
+    Status HTTP de un error de los SDKs, o None si no vino de una respuesta:
+    la respuesta de httpx que originó el error (Supabase) o el atributo
+    `status` (ApiException de Brevo, StorageApiError de Supabase, que a veces
+    lo trae como texto).
+    """
+    chain = []
+    while exc is not None and len(chain) < 5:
+        chain.append(exc)
+        exc = exc.__cause__ or exc.__context__
+    for error in chain:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+        if isinstance(status, int):
+            return status
+    for error in chain:
+        try:
+            return int(getattr(error, "status", None))
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def is_provider_failure(exc) -> bool:
+    # Un 4xx (salvo 429) es un problema del pedido, ej. un archivo que ya existe
+    # o un email inválido, no del proveedor: no cuenta para el breaker
+    status = http_status(exc)
+    return not (status is not None and 400 <= status < 500 and status != 429)
+
+
+def _provider_from_env(name: str, prefix: str, is_failure=None) -> Provider:
+    return Provider(
+        name,
+        timeout=float(os.getenv(f"{prefix}_TIMEOUT", "10")),
+        max_concurrent=int(os.getenv(f"{prefix}_MAX_CONCURRENT", "4")),
+        failure_threshold=int(os.getenv(f"{prefix}_FAILURE_THRESHOLD", "5")),
+        reset_timeout=float(os.getenv(f"{prefix}_RESET_TIMEOUT", "30")),
+        is_failure=is_failure,
+    )
+
+
+supabase_provider = _provider_from_env("supabase", "SUPABASE", is_failure=is_provider_failure)
+brevo_provider = _provider_from_env("brevo", "BREVO", is_failure=is_provider_failure)
+
+PROVIDERS = {p.name: p for p in (supabase_provider, brevo_provider)}
+
+
+def integration_status():
+    return [provider.snapshot() for provider in PROVIDERS.values()]
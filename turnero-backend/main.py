@@ -1,11 +1,11 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Header, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import Response
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 import models
-from database import engine, get_db
-models.Base.metadata.create_all(bind=engine)
-from pydantic import BaseModel
+from database import get_db, engine, SessionLocal
 from typing import List
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from passlib.context import CryptContext
@@ -15,16 +15,38 @@ from fastapi.staticfiles import StaticFiles
 from fastapi import File, UploadFile
 import shutil
 import uuid
+import secrets
 import os
-from supabase import create_client, Client
-import sib_api_v3_sdk
-from sib_api_v3_sdk.rest import ApiException
+from functools import lru_cache
+from allocator import load_resource_index, eligible_resources
+from schemas import (
+    ScheduleSchema, ScheduleOverrideSchema, ProfileSchema, AppointmentSeriesSchema,
+    MessageOut, StatusOut, ServiceOut, StaffOut, AppointmentOut, AppointmentSeriesOut, BusySlotOut,
+    AvailableSlotOut, ScheduleOut, ScheduleOverrideOut, ScheduleDayOut, PublicProfileOut, ProfileOut,
+    TokenOut, UploadOut, MonthlyHistoryOut, ArchiveQueryOut,
+    ServiceAnalyticsOut, HeatmapCellOut, RollupRebuildOut, CustomerOut, CalendarTokenOut, AdminUserOut,
+    IntegrationStatusOut, PurgeJobOut, RequestProfileSummaryOut, RequestProfileOut
+)
+import archive
+import rollups
+from rollups import COMPLETED_STATUSES
+from customers import upsert_customer, find_customers
+import calendar_feed
+import tenant_purge
+import profiling
+from integrations import supabase_provider, brevo_provider, integration_status, IntegrationError
+from idempotency import (
+    get_idempotency_store, fingerprint, IdempotencyConflict, IdempotencyInProgress
+)
+from schedule_cache import (
+    get_compiled_schedule, invalidate_schedule, parse_day_of_week, parse_hhmm, format_hhmm,
+    normalize_range
+)
 
 
 SECRET_KEY = os.getenv("CLAVE")
 ALGORITHM = os.getenv("ALGORITMO")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("TIEMPO"))
-HASH_PWWD = os.getenv("HASH_PWW")
 
 pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token") 
@@ -60,6 +82,10 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     user = db.query(models.User).filter(models.User.username == username).first()
     if user is None:
         raise credentials_exception
+    # Suspender (is_active) solo oculta la página pública; el panel se bloquea
+    # recién cuando se pidió borrar el negocio
+    if user.purge_requested_at is not None:
+        raise HTTPException(status_code=403, detail="La cuenta está siendo eliminada")
     return user
 
 def get_current_admin(current_user: models.User = Depends(get_current_user)):
@@ -67,50 +93,20 @@ def get_current_admin(current_user: models.User = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="No tienes permisos de administrador")
     return current_user
 
-models.Base.metadata.create_all(bind=engine)
-
-def run_migrations_and_seed():
+def profiling_admin(token: str):
+    """Id del admin dueño del token, o None. Lo usa el middleware de perfilado."""
     db = SessionLocal()
     try:
-        from sqlalchemy import text
-        print("Verificando esquema de base de datos...")
-        # Agregar columnas si faltan (PostgreSQL/SQLite safe)
-        columns = [
-            ("is_admin", "BOOLEAN DEFAULT FALSE"),
-            ("subscription_active", "BOOLEAN DEFAULT TRUE"),
-            ("created_at", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
-        ]
-        for col, typ in columns:
-            try:
-                db.execute(text(f"ALTER TABLE users ADD COLUMN {col} {typ};"))
-                db.commit()
-                print(f"Columna '{col}' agregada a 'users' con éxito.")
-            except Exception:
-                db.rollback()
-                pass
-
-        # Sembrar Administrador
-        admin_username = "Administrador"
-        existing_admin = db.query(models.User).filter(models.User.username == admin_username).first()
-        if not existing_admin:
-            print("Creando usuario Administrador inicial...")
-            hashed_pwd = get_password_hash(HASH_PWWD)
-            new_admin = models.User(
-                username=admin_username, 
-                hashed_password=hashed_pwd, 
-                is_admin=True,
-                subscription_active=True
-            )
-            db.add(new_admin)
-            db.commit()
-            print("Usuario Administrador creado.")
+        return get_current_admin(get_current_user(token, db)).id
+    except HTTPException:
+        return None
     finally:
         db.close()
 
-from database import SessionLocal
-run_migrations_and_seed()
+# El esquema y el usuario Administrador se crean con `python manage.py migrate`
+# y `python manage.py seed-admin`, no al importar este módulo.
 
-app = FastAPI(title="BarberShop API")
+app = FastAPI(title="BarberShop API", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -120,33 +116,74 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Perfilado de requests puntuales con `X-Profile: 1` (solo admins, ver profiling.py)
+app.add_middleware(profiling.ProfilingMiddleware, engine=engine, authorize=profiling_admin)
+
 # Configuración Supabase
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 # Configuración Brevo
 BREVO_API_KEY = os.getenv("BREVO_API_KEY")
-configuration = sib_api_v3_sdk.Configuration()
-configuration.api_key['api-key'] = BREVO_API_KEY
-brevo_api = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
+# Permite apuntar a un servidor falso en pruebas (ver fake_providers.py)
+BREVO_API_HOST = os.getenv("BREVO_API_HOST")
+
+# Los clientes externos se crean (e importan) recién en el primer uso,
+# así los workers arrancan sin pagar el costo de los SDKs.
+@lru_cache(maxsize=None)
+def get_supabase():
+    from supabase import create_client, ClientOptions
+    # Timeout del propio SDK, para que la llamada abandonada no quede colgada
+    options = ClientOptions(storage_client_timeout=int(supabase_provider.timeout) + 1)
+    return create_client(SUPABASE_URL, SUPABASE_KEY, options=options)
+
+@lru_cache(maxsize=None)
+def get_brevo_api():
+    import sib_api_v3_sdk
+    configuration = sib_api_v3_sdk.Configuration()
+    configuration.api_key['api-key'] = BREVO_API_KEY
+    if BREVO_API_HOST:
+        configuration.host = BREVO_API_HOST
+    return sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
 
 
 # Montar archivos estáticos
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
-@app.get("/")
+# Columnas que se exponen de cada tabla; las consultas traen solo estas
+SERVICE_COLUMNS = (models.Service.id, models.Service.name, models.Service.price, models.Service.duration)
+SCHEDULE_COLUMNS = (
+    models.Schedule.id, models.Schedule.day_of_week, models.Schedule.is_open,
+    models.Schedule.start_time, models.Schedule.end_time
+)
+PUBLIC_PROFILE_COLUMNS = (
+    models.Profile.name, models.Profile.slug, models.Profile.specialty, models.Profile.bio,
+    models.Profile.avatar_url, models.Profile.appointment_interval
+)
+PROFILE_COLUMNS = PUBLIC_PROFILE_COLUMNS + (models.Profile.monthly_goal,)
+APPOINTMENT_COLUMNS = (
+    models.Appointment.id, models.Appointment.service_id, models.Appointment.staff_id,
+    models.Appointment.customer_id, models.Appointment.customer_name,
+    models.Appointment.customer_email, models.Appointment.customer_phone, models.Appointment.date_time,
+    models.Appointment.price, models.Appointment.status
+)
+
+def columns_of(obj, columns):
+    return {c.key: getattr(obj, c.key) for c in columns}
+
+@app.get("/", response_model=MessageOut)
 def read_root():
     return {"message": "Barber API Online"}
 
-@app.get("/services")
+@app.get("/services", response_model=List[ServiceOut])
 def get_services(
     db: Session = Depends(get_db), 
     current_user: models.User = Depends(get_current_user)
 ):
-    return db.query(models.Service).filter(models.Service.owner_id == current_user.id).all()
+    rows = db.query(*SERVICE_COLUMNS).filter(models.Service.owner_id == current_user.id).all()
+    return [r._asdict() for r in rows]
 
-@app.post("/services")
+@app.post("/services", response_model=ServiceOut)
 def create_service(
     name: str, price: float, duration: int, 
     db: Session = Depends(get_db),
@@ -158,9 +195,10 @@ def create_service(
     )
     db.add(new_service)
     db.commit()
-    return new_service
+    db.refresh(new_service)
+    return columns_of(new_service, SERVICE_COLUMNS)
 
-@app.put("/services/{service_id}")
+@app.put("/services/{service_id}", response_model=ServiceOut)
 def update_service(
     service_id: int, 
     name: str, price: float, duration: int,
@@ -180,8 +218,9 @@ def update_service(
     service.duration = duration
     db.commit()
     db.refresh(service)
-    return service
-@app.get("/services/{slug}")
+    return columns_of(service, SERVICE_COLUMNS)
+
+@app.get("/services/{slug}", response_model=List[ServiceOut])
 def get_public_services(slug: str, db: Session = Depends(get_db)):
     profile = db.query(models.Profile).filter(models.Profile.slug == slug).first()
     if not profile:
@@ -191,9 +230,10 @@ def get_public_services(slug: str, db: Session = Depends(get_db)):
     if not profile.owner.is_active:
         raise HTTPException(status_code=404, detail="Este Negocio se encuentra suspendido")
 
-    return db.query(models.Service).filter(models.Service.owner_id == profile.owner_id).all()
+    rows = db.query(*SERVICE_COLUMNS).filter(models.Service.owner_id == profile.owner_id).all()
+    return [r._asdict() for r in rows]
 
-@app.get("/appointments")
+@app.get("/appointments", response_model=List[AppointmentOut])
 def get_appointments(
     status: str = None, 
     date: str = None,
@@ -202,7 +242,7 @@ def get_appointments(
 ):
     # Usamos un join para traer el nombre del servicio directamente
     query = db.query(
-        models.Appointment,
+        *APPOINTMENT_COLUMNS,
         models.Service.name.label("service_name")
     ).join(
         models.Service, models.Appointment.service_id == models.Service.id
@@ -224,18 +264,10 @@ def get_appointments(
             raise HTTPException(status_code=400, detail="Formato de fecha inválido (YYYY-MM-DD)")
             
     results = query.order_by(models.Appointment.date_time.asc()).all()
-    
-    # Aplanamos el resultado para que el frontend lo reciba igual que antes + service_name
-    appointments = []
-    for apt, s_name in results:
-        apt_dict = {column.name: getattr(apt, column.name) for column in apt.__table__.columns}
-        apt_dict["service_name"] = s_name
-        appointments.append(apt_dict)
-        
-    return appointments
+    return [r._asdict() for r in results]
 
-@app.get("/appointments/public/{slug}")
-def get_public_appointments(slug: str, date: str, db: Session = Depends(get_db)):
+@app.get("/appointments/public/{slug}", response_model=List[BusySlotOut])
+def get_public_appointments(slug: str, date: str, service_id: int = None, db: Session = Depends(get_db)):
     profile = db.query(models.Profile).filter(models.Profile.slug == slug).first()
     if not profile:
         raise HTTPException(status_code=404, detail="Negocio no encontrado")
@@ -249,63 +281,190 @@ def get_public_appointments(slug: str, date: str, db: Session = Depends(get_db))
     except ValueError:
         raise HTTPException(status_code=400, detail="Formato de fecha inválido (YYYY-MM-DD)")
 
-    # Buscar turnos para ese día y ese barbero
+    # Buscar turnos para ese día, agrupados por profesional
     start_day = search_date.replace(hour=0, minute=0, second=0)
-    end_day = search_date.replace(hour=23, minute=59, second=59)
+    end_day = start_day + timedelta(days=1)
 
-    appointments = db.query(models.Appointment).filter(
-        models.Appointment.owner_id == profile.owner_id,
-        models.Appointment.date_time >= start_day,
-        models.Appointment.date_time <= end_day,
-        models.Appointment.status != "cancelled"
-    ).all()
+    index = load_resource_index(
+        db, profile.owner_id, start_day, end_day,
+        default_duration=profile.appointment_interval or 30
+    )
+    eligible = eligible_resources(db, index, service_id)
 
-    # Solo devolver las horas ocupadas y su duración
+    # Un horario solo está ocupado si no queda ningún profesional elegible libre
     return [
-        {"time": a.date_time.strftime("%H:%M"), "duration": a.service.duration} 
-        for a in appointments
+        {"time": start.strftime("%H:%M"), "duration": int((end - start).total_seconds() // 60)}
+        for start, end in index.fully_busy(eligible, start_day, end_day)
+        if start < end_day and end > start_day
     ]
 
-@app.post("/appointments")
+# La búsqueda del próximo turno libre carga los turnos de a ventanas de varias
+# semanas (una consulta por ventana) y no mira más allá del horizonte.
+AVAILABILITY_WINDOW_DAYS = 28
+AVAILABILITY_MAX_DAYS = 91
+MAX_AVAILABILITY_RESULTS = 20
+
+@app.get("/availability/{slug}/next", response_model=List[AvailableSlotOut])
+def get_next_available(
+    slug: str,
+    service_id: int,
+    from_date: str = Query(None, alias="from"),
+    limit: int = Query(1, ge=1, le=MAX_AVAILABILITY_RESULTS),
+    db: Session = Depends(get_db)
+):
+    profile = db.query(models.Profile).filter(models.Profile.slug == slug).first()
+    if not profile:
+        raise HTTPException(status_code=404, detail="Negocio no encontrado")
+
+    if not profile.owner.is_active:
+        raise HTTPException(status_code=404, detail="Negocio suspendido")
+
+    service = db.query(models.Service).filter(
+        models.Service.id == service_id,
+        models.Service.owner_id == profile.owner_id
+    ).first()
+    if not service:
+        raise HTTPException(status_code=404, detail="Servicio no encontrado")
+
+    # "from" acepta una fecha (YYYY-MM-DD) o una fecha y hora; nunca antes de ahora
+    now = datetime.now().replace(second=0, microsecond=0)
+    not_before = now
+    if from_date:
+        if len(from_date) == 10:
+            not_before = datetime.combine(parse_date_range(from_date, None)[0], datetime.min.time())
+        else:
+            not_before = parse_appointment_datetime(from_date)
+        not_before = max(not_before, now)
+
+    interval = profile.appointment_interval or 30
+    duration = service.duration or interval
+    compiled = get_compiled_schedule(db, profile.owner_id)
+
+    found = []
+    first_day = not_before.date()
+    horizon = first_day + timedelta(days=AVAILABILITY_MAX_DAYS)
+    while len(found) < limit and first_day < horizon:
+        last_day = min(first_day + timedelta(days=AVAILABILITY_WINDOW_DAYS), horizon)
+        window_start = datetime.combine(first_day, datetime.min.time())
+        index = load_resource_index(
+            db, profile.owner_id, window_start, datetime.combine(last_day, datetime.min.time()),
+            default_duration=interval
+        )
+        starts = (
+            start for start in compiled.slot_starts(first_day, last_day, interval, duration)
+            if start >= not_before
+        )
+        found += index.first_free(
+            eligible_resources(db, index, service.id), starts,
+            timedelta(minutes=duration), limit - len(found)
+        )
+        first_day = last_day
+
+    return [
+        {
+            "date_time": start, "date": start.strftime("%Y-%m-%d"),
+            "time": start.strftime("%H:%M"), "duration": duration,
+        }
+        for start, _ in found
+    ]
+
+@app.post("/appointments", response_model=AppointmentOut)
 def create_appointment(
     customer_name: str, 
     service_id: int, 
     date_time: str,
     customer_email: str = None,
     customer_phone: str = None,
+    idempotency_key: str = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db)
 ):
-    # Parsear fecha
+    params = (customer_name, service_id, date_time, customer_email, customer_phone)
+    if not idempotency_key:
+        return book_appointment(db, *params)
+
+    # Los reintentos con la misma clave devuelven la respuesta original sin volver a reservar
+    store = get_idempotency_store()
+    try:
+        stored = store.reserve(idempotency_key, fingerprint(*params))
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="La Idempotency-Key ya se usó con otros datos")
+    except IdempotencyInProgress:
+        raise HTTPException(status_code=409, detail="La solicitud original todavía está en proceso")
+    if stored:
+        return ORJSONResponse(
+            status_code=stored.status_code, content=stored.body,
+            headers={"Idempotent-Replayed": "true"}
+        )
+
+    try:
+        result = book_appointment(db, *params)
+    except HTTPException as e:
+        # Los errores del cliente (ej. horario ocupado) también se repiten tal cual
+        if e.status_code < 500:
+            store.complete(idempotency_key, e.status_code, {"detail": e.detail})
+        else:
+            store.release(idempotency_key)
+        raise
+    except Exception:
+        store.release(idempotency_key)
+        raise
+    store.complete(idempotency_key, 200, AppointmentOut(**result).model_dump(mode="json"))
+    return result
+
+def parse_appointment_datetime(date_time: str) -> datetime:
     try:
         # Si viene con Z, lo tratamos como UTC y lo convertimos a naive local (o lo guardamos tal cual)
         # Pero si el frontend manda local nominal, fromisoformat lo toma bien.
         if "Z" in date_time:
-            dt_obj = datetime.fromisoformat(date_time.replace("Z", "+00:00")).replace(tzinfo=None)
-        else:
-            dt_obj = datetime.fromisoformat(date_time)
+            return datetime.fromisoformat(date_time.replace("Z", "+00:00")).replace(tzinfo=None)
+        return datetime.fromisoformat(date_time)
     except ValueError:
         raise HTTPException(status_code=400, detail="Formato de fecha inválido")
 
+def book_appointment(
+    db: Session,
+    customer_name: str,
+    service_id: int,
+    date_time: str,
+    customer_email: str = None,
+    customer_phone: str = None
+):
+    # Parsear fecha
+    dt_obj = parse_appointment_datetime(date_time)
+
     # Obtener el owner_id desde el servicio
     service = db.query(models.Service).filter(models.Service.id == service_id).first()
     if not service:
         raise HTTPException(status_code=404, detail="Servicio no encontrado")
+    if service.owner.is_active is False:
+        # Negocio suspendido o en proceso de eliminación
+        raise HTTPException(status_code=404, detail="Negocio suspendido")
 
-    # VALIDACIÓN: Prevenir doble reserva
-    existing = db.query(models.Appointment).filter(
-        models.Appointment.owner_id == service.owner_id,
-        models.Appointment.date_time == dt_obj,
-        models.Appointment.status != "cancelled"
-    ).first()
+    # VALIDACIÓN: El turno tiene que caer dentro del horario de atención
+    if not get_compiled_schedule(db, service.owner_id).accepts(dt_obj, service.duration or 30):
+        raise HTTPException(status_code=400, detail="El horario está fuera del horario de atención")
+
+    # VALIDACIÓN: Prevenir doble reserva asignando el primer profesional libre
+    end_time = dt_obj + timedelta(minutes=service.duration or 30)
+    index = load_resource_index(db, service.owner_id, dt_obj, end_time)
+    eligible = eligible_resources(db, index, service.id)
+    if not eligible:
+        raise HTTPException(status_code=400, detail="El servicio no tiene profesionales disponibles")
+    staff_id = index.find_free(eligible, dt_obj, end_time)
     
-    if existing:
+    if staff_id is False:
         raise HTTPException(status_code=400, detail="Este horario ya está reservado")
 
+    # Registrar o actualizar al cliente en el directorio del negocio
+    customer = upsert_customer(db, service.owner_id, customer_name, customer_email, customer_phone, dt_obj)
+
     new_appo = models.Appointment(
         customer_name=customer_name,
         customer_email=customer_email,
         customer_phone=customer_phone,
+        customer_id=customer.id if customer else None,
         service_id=service_id,
+        staff_id=staff_id,
         date_time=dt_obj,
         owner_id=service.owner_id,
         price=service.price
@@ -313,9 +472,121 @@ def create_appointment(
     db.add(new_appo)
     db.commit()
     db.refresh(new_appo)
-    return new_appo
+    calendar_feed.invalidate_calendar(service.owner_id)
+    return {**columns_of(new_appo, APPOINTMENT_COLUMNS), "service_name": service.name}
+
+# Tope de turnos por serie (dos años semanales)
+MAX_SERIES_OCCURRENCES = 104
+
+@app.post("/appointments/series", response_model=AppointmentSeriesOut)
+def create_appointment_series(
+    data: AppointmentSeriesSchema,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    start = parse_appointment_datetime(data.start)
+    if data.count is None and not data.until:
+        raise HTTPException(status_code=400, detail="Indicar una fecha final (until) o una cantidad (count)")
+    try:
+        until = datetime.strptime(data.until, "%Y-%m-%d").date() if data.until else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha inválido (YYYY-MM-DD)")
+
+    service = db.query(models.Service).filter(
+        models.Service.id == data.service_id,
+        models.Service.owner_id == current_user.id
+    ).first()
+    if not service:
+        raise HTTPException(status_code=404, detail="Servicio no encontrado")
+    if service.owner.is_active is False:
+        raise HTTPException(status_code=404, detail="Negocio suspendido")
+
+    # Expandir la regla
+    step = timedelta(weeks=data.interval_weeks)
+    limit = min(data.count or MAX_SERIES_OCCURRENCES, MAX_SERIES_OCCURRENCES)
+    occurrences = []
+    current = start
+    while len(occurrences) < limit and (until is None or current.date() <= until):
+        occurrences.append(current)
+        current += step
+    if not occurrences:
+        raise HTTPException(status_code=400, detail="La serie no tiene turnos en ese rango")
+
+    duration = timedelta(minutes=service.duration or 30)
+
+    # Una sola consulta para todo el rango y barrido en memoria
+    index = load_resource_index(db, current_user.id, occurrences[0], occurrences[-1] + duration)
+    eligible = eligible_resources(db, index, service.id)
+    if not eligible:
+        raise HTTPException(status_code=400, detail="El servicio no tiene profesionales disponibles")
+    compiled = get_compiled_schedule(db, current_user.id)
+
+    accepted = []
+    conflicts = []
+    for occ_start in occurrences:
+        occ_end = occ_start + duration
+        if not compiled.accepts(occ_start, int(duration.total_seconds() // 60)):
+            conflicts.append({"date_time": occ_start, "reason": "fuera_de_horario"})
+            continue
+        staff_id = index.find_free(eligible, occ_start, occ_end)
+        if staff_id is False:
+            conflicts.append({"date_time": occ_start, "reason": "ocupado"})
+            continue
+        index.reserve(staff_id, occ_start, occ_end)
+        accepted.append((occ_start, staff_id))
+
+    if not accepted:
+        return {"series_id": None, "created": [], "conflicts": conflicts}
+
+    # El primer turno de la serie es la primera visita; el último, la más reciente
+    customer = upsert_customer(
+        db, current_user.id, data.customer_name, data.customer_email, data.customer_phone, accepted[0][0]
+    )
+    if customer:
+        customer.visits += len(accepted) - 1
+        customer.last_seen_at = max(customer.last_seen_at or accepted[-1][0], accepted[-1][0])
+
+    # Todos los turnos de la serie en una sola transacción
+    series_id = str(uuid.uuid4())
+    new_appointments = [
+        models.Appointment(
+            customer_name=data.customer_name,
+            customer_email=data.customer_email,
+            customer_phone=data.customer_phone,
+            customer_id=customer.id if customer else None,
+            service_id=service.id,
+            staff_id=staff_id,
+            series_id=series_id,
+            date_time=occ_start,
+            owner_id=current_user.id,
+            price=service.price
+        )
+        for occ_start, staff_id in accepted
+    ]
+    db.add_all(new_appointments)
+    db.commit()
+    calendar_feed.invalidate_calendar(current_user.id)
+
+    return {
+        "series_id": series_id,
+        "created": [
+            {**columns_of(apt, APPOINTMENT_COLUMNS), "service_name": service.name}
+            for apt in new_appointments
+        ],
+        "conflicts": conflicts,
+    }
+
+@app.get("/customers/search", response_model=List[CustomerOut])
+def search_customers(
+    q: str,
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    # Búsqueda por prefijo de nombre, email o teléfono, resuelta en la base
+    return find_customers(db, current_user.id, q, limit)
 
-@app.patch("/appointments/{appointment_id}/status")
+@app.patch("/appointments/{appointment_id}/status", response_model=MessageOut)
 def update_status(
     appointment_id: int, 
     status: str, 
@@ -346,13 +617,20 @@ def update_status(
                 print(f"Error al enviar email de cancelación: {e}")
                 # No bloqueamos la cancelación si falla el email
         
+        # Los resúmenes de /finance/analytics van en la misma transacción, justo
+        # antes del commit: sus filas son compartidas por todos los turnos de
+        # esa hora y no deben quedar bloqueadas mientras se envía el email
+        rollups.apply_status_change(db, appointment, appointment.status, status)
         db.delete(appointment)
         db.commit()
+        calendar_feed.invalidate_calendar(current_user.id)
         return {"message": "Turno eliminado"}
     
     # Para otros estados, actualizar
+    rollups.apply_status_change(db, appointment, appointment.status, status)
     appointment.status = status
     db.commit()
+    calendar_feed.invalidate_calendar(current_user.id)
     
     # Si el estado es "confirmed" o "concretado", enviar email de confirmación
     if status in ["confirmed", "concretado"] and appointment.customer_email:
@@ -379,6 +657,8 @@ def send_confirmation_email(customer_name: str, customer_email: str, service_nam
         print("ADVERTENCIA: BREVO_API_KEY no está configurado. El email no será enviado.")
         return
     
+    import sib_api_v3_sdk
+    from sib_api_v3_sdk.rest import ApiException
     try:
         # Formatear la fecha del turno
         from datetime import datetime
@@ -424,13 +704,19 @@ def send_confirmation_email(customer_name: str, customer_email: str, service_nam
         )
         
         # Enviar el email
-        api_response = brevo_api.send_transac_email(send_smtp_email)
+        api_response = brevo_provider.call(
+            get_brevo_api().send_transac_email, send_smtp_email,
+            _request_timeout=brevo_provider.timeout + 1
+        )
         print(f"Email de confirmación enviado exitosamente a {customer_email}")
         return api_response
         
     except ApiException as e:
         print(f"Error de Brevo API al enviar email: {e}")
         raise
+    except IntegrationError as e:
+        print(f"Brevo no disponible, no se envió el email: {e}")
+        raise
     except Exception as e:
         print(f"Error inesperado al enviar email: {e}")
         raise
@@ -443,6 +729,8 @@ def send_cancellation_email(customer_name: str, customer_email: str, service_nam
         print("ADVERTENCIA: BREVO_API_KEY no está configurado. El email no será enviado.")
         return
     
+    import sib_api_v3_sdk
+    from sib_api_v3_sdk.rest import ApiException
     try:
         # Formatear la fecha del turno
         from datetime import datetime
@@ -488,18 +776,24 @@ def send_cancellation_email(customer_name: str, customer_email: str, service_nam
         )
         
         # Enviar el email
-        api_response = brevo_api.send_transac_email(send_smtp_email)
+        api_response = brevo_provider.call(
+            get_brevo_api().send_transac_email, send_smtp_email,
+            _request_timeout=brevo_provider.timeout + 1
+        )
         print(f"Email de cancelación enviado exitosamente a {customer_email}")
         return api_response
         
     except ApiException as e:
         print(f"Error de Brevo API al enviar email de cancelación: {e}")
         raise
+    except IntegrationError as e:
+        print(f"Brevo no disponible, no se envió el email de cancelación: {e}")
+        raise
     except Exception as e:
         print(f"Error inesperado al enviar email de cancelación: {e}")
         raise
 
-@app.delete("/services/{service_id}")
+@app.delete("/services/{service_id}", response_model=MessageOut)
 def delete_service(
     service_id: int, 
     db: Session = Depends(get_db),
@@ -516,34 +810,230 @@ def delete_service(
     return {"message": "Servicio eliminado"}
 
 
-class ScheduleSchema(BaseModel):
-    day_of_week: str
-    is_open: bool
-    start_time: str
-    end_time: str
+def serialize_staff(member: models.Staff):
+    return {"id": member.id, "name": member.name, "is_active": member.is_active}
+
+@app.get("/staff", response_model=List[StaffOut])
+def get_staff(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    members = db.query(models.Staff).filter(
+        models.Staff.owner_id == current_user.id
+    ).order_by(models.Staff.id).all()
+    return [serialize_staff(m) for m in members]
+
+@app.post("/staff", response_model=StaffOut)
+def create_staff(
+    name: str,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    member = models.Staff(name=name, owner_id=current_user.id, is_active=True)
+    db.add(member)
+    db.commit()
+    db.refresh(member)
+    return serialize_staff(member)
+
+@app.put("/staff/{staff_id}", response_model=StaffOut)
+def update_staff(
+    staff_id: int,
+    name: str = None,
+    is_active: bool = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    member = db.query(models.Staff).filter(
+        models.Staff.id == staff_id,
+        models.Staff.owner_id == current_user.id
+    ).first()
+    if not member:
+        raise HTTPException(status_code=404, detail="Profesional no encontrado")
+
+    if name is not None:
+        member.name = name
+    if is_active is not None:
+        member.is_active = is_active
+    db.commit()
+    db.refresh(member)
+    return serialize_staff(member)
+
+@app.delete("/staff/{staff_id}", response_model=MessageOut)
+def delete_staff(
+    staff_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    member = db.query(models.Staff).filter(
+        models.Staff.id == staff_id,
+        models.Staff.owner_id == current_user.id
+    ).first()
+    if not member:
+        raise HTTPException(status_code=404, detail="Profesional no encontrado")
+
+    # Los turnos del profesional quedan sin asignar en vez de perderse
+    db.query(models.Appointment).filter(
+        models.Appointment.staff_id == staff_id
+    ).update({models.Appointment.staff_id: None}, synchronize_session=False)
+    member.services = []
+    db.delete(member)
+    db.commit()
+    return {"message": "Profesional eliminado"}
 
-@app.get("/schedule")
+@app.get("/services/{service_id}/staff", response_model=List[StaffOut])
+def get_service_staff(
+    service_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    service = db.query(models.Service).filter(
+        models.Service.id == service_id,
+        models.Service.owner_id == current_user.id
+    ).first()
+    if not service:
+        raise HTTPException(status_code=404, detail="Servicio no encontrado")
+    return [serialize_staff(m) for m in service.staff]
+
+@app.put("/services/{service_id}/staff", response_model=List[StaffOut])
+def set_service_staff(
+    service_id: int,
+    staff_ids: List[int],
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    service = db.query(models.Service).filter(
+        models.Service.id == service_id,
+        models.Service.owner_id == current_user.id
+    ).first()
+    if not service:
+        raise HTTPException(status_code=404, detail="Servicio no encontrado")
+
+    members = db.query(models.Staff).filter(
+        models.Staff.owner_id == current_user.id,
+        models.Staff.id.in_(staff_ids)
+    ).all() if staff_ids else []
+    if len(members) != len(set(staff_ids)):
+        raise HTTPException(status_code=404, detail="Profesional no encontrado")
+
+    # Lista vacía = cualquier profesional puede realizar el servicio
+    service.staff = members
+    db.commit()
+    return [serialize_staff(m) for m in members]
+
+@app.get("/schedule", response_model=List[ScheduleOut])
 def get_schedule(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    return db.query(models.Schedule).filter(models.Schedule.owner_id == current_user.id).all()
+    rows = db.query(*SCHEDULE_COLUMNS).filter(models.Schedule.owner_id == current_user.id).all()
+    return [r._asdict() for r in rows]
 
-@app.post("/schedule")
+@app.post("/schedule", response_model=MessageOut)
 def update_schedule(schedules: List[ScheduleSchema], db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    # Eliminar solo los horarios del usuario actual
-    db.query(models.Schedule).filter(models.Schedule.owner_id == current_user.id).delete()    
+    # Agrupar los horarios existentes por día para reutilizar sus filas
+    existing = {}
+    for row in db.query(models.Schedule).filter(
+        models.Schedule.owner_id == current_user.id
+    ).order_by(models.Schedule.id).all():
+        existing.setdefault(row.day_of_week, []).append(row)
+
     for s in schedules:
-        db_schedule = models.Schedule(
-            day_of_week=s.day_of_week,
-            is_open=s.is_open,
-            start_time=s.start_time,
-            end_time=s.end_time,
-            owner_id=current_user.id
-        )
-        db.add(db_schedule)
+        start_minute = parse_hhmm(s.start_time)
+        end_minute = parse_hhmm(s.end_time)
+        if s.is_open and (start_minute is None or end_minute is None):
+            raise HTTPException(status_code=400, detail="Formato de hora inválido (HH:MM)")
+        if s.is_open and normalize_range(start_minute, end_minute) is None:
+            raise HTTPException(status_code=400, detail="La hora de cierre debe ser posterior a la de apertura")
+        weekday = parse_day_of_week(s.day_of_week)
+        if weekday is None:
+            raise HTTPException(status_code=400, detail=f"Día de la semana inválido: {s.day_of_week}")
+
+        values = {
+            "day_of_week": s.day_of_week,
+            "is_open": s.is_open,
+            "start_time": s.start_time,
+            "end_time": s.end_time,
+            "weekday": weekday,
+            "start_minute": start_minute,
+            "end_minute": end_minute,
+        }
+        rows = existing.get(s.day_of_week)
+        if rows:
+            # Solo se escriben las columnas que cambiaron
+            row = rows.pop(0)
+            for field, value in values.items():
+                if getattr(row, field) != value:
+                    setattr(row, field, value)
+        else:
+            db.add(models.Schedule(owner_id=current_user.id, **values))
+
+    # Los días que ya no vienen en la lista se eliminan
+    for rows in existing.values():
+        for row in rows:
+            db.delete(row)
     
     db.commit()
+    invalidate_schedule(current_user.id)
     return {"message": "Horarios actualizados"}
 
-@app.get("/schedule/{slug}")
+def serialize_override(override: models.ScheduleOverride):
+    return {
+        "id": override.id,
+        "date": override.date.isoformat(),
+        "is_open": override.is_open,
+        "start_time": format_hhmm(override.start_minute) if override.start_minute is not None else None,
+        "end_time": format_hhmm(override.end_minute) if override.end_minute is not None else None,
+        "note": override.note,
+    }
+
+@app.get("/schedule/overrides", response_model=List[ScheduleOverrideOut])
+def get_schedule_overrides(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    overrides = db.query(models.ScheduleOverride).filter(
+        models.ScheduleOverride.owner_id == current_user.id
+    ).order_by(models.ScheduleOverride.date.asc()).all()
+    return [serialize_override(o) for o in overrides]
+
+@app.post("/schedule/overrides", response_model=ScheduleOverrideOut)
+def upsert_schedule_override(data: ScheduleOverrideSchema, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    try:
+        override_date = datetime.strptime(data.date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha inválido (YYYY-MM-DD)")
+
+    start_minute = parse_hhmm(data.start_time)
+    end_minute = parse_hhmm(data.end_time)
+    if data.is_open and (start_minute is None or end_minute is None):
+        raise HTTPException(status_code=400, detail="Formato de hora inválido (HH:MM)")
+    if data.is_open and normalize_range(start_minute, end_minute) is None:
+        raise HTTPException(status_code=400, detail="La hora de cierre debe ser posterior a la de apertura")
+
+    # Una sola excepción por fecha: si ya existe se actualiza
+    override = db.query(models.ScheduleOverride).filter(
+        models.ScheduleOverride.owner_id == current_user.id,
+        models.ScheduleOverride.date == override_date
+    ).first()
+    if not override:
+        override = models.ScheduleOverride(owner_id=current_user.id, date=override_date)
+        db.add(override)
+
+    override.is_open = data.is_open
+    override.start_minute = start_minute if data.is_open else None
+    override.end_minute = end_minute if data.is_open else None
+    override.note = data.note
+
+    db.commit()
+    db.refresh(override)
+    invalidate_schedule(current_user.id)
+    return serialize_override(override)
+
+@app.delete("/schedule/overrides/{override_id}", response_model=MessageOut)
+def delete_schedule_override(override_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    override = db.query(models.ScheduleOverride).filter(
+        models.ScheduleOverride.id == override_id,
+        models.ScheduleOverride.owner_id == current_user.id
+    ).first()
+    if not override:
+        raise HTTPException(status_code=404, detail="Excepción de horario no encontrada")
+    db.delete(override)
+    db.commit()
+    invalidate_schedule(current_user.id)
+    return {"message": "Excepción de horario eliminada"}
+
+@app.get("/schedule/{slug}", response_model=List[ScheduleOut])
 def get_public_schedule(slug: str, db: Session = Depends(get_db)):
     profile = db.query(models.Profile).filter(models.Profile.slug == slug).first()
     if not profile:
@@ -552,18 +1042,32 @@ def get_public_schedule(slug: str, db: Session = Depends(get_db)):
     if not profile.owner.is_active:
         raise HTTPException(status_code=404, detail="Negocio suspendido")
 
-    return db.query(models.Schedule).filter(models.Schedule.owner_id == profile.owner_id).all()
+    rows = db.query(*SCHEDULE_COLUMNS).filter(models.Schedule.owner_id == profile.owner_id).all()
+    return [r._asdict() for r in rows]
+
+@app.get("/schedule/{slug}/day", response_model=ScheduleDayOut)
+def get_public_schedule_day(slug: str, date: str, db: Session = Depends(get_db)):
+    profile = db.query(models.Profile).filter(models.Profile.slug == slug).first()
+    if not profile:
+        raise HTTPException(status_code=404, detail="Negocio no encontrado")
+    
+    if not profile.owner.is_active:
+        raise HTTPException(status_code=404, detail="Negocio suspendido")
+
+    try:
+        search_date = datetime.strptime(date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha inválido (YYYY-MM-DD)")
 
-class ProfileSchema(BaseModel):
-    name: str
-    slug: str
-    specialty: str
-    bio: str
-    avatar_url: str
-    monthly_goal: int
-    appointment_interval: int
+    # Horario semanal con las excepciones de esa fecha ya aplicadas
+    ranges = get_compiled_schedule(db, profile.owner_id).ranges_for(search_date)
+    return {
+        "date": search_date.isoformat(),
+        "is_open": bool(ranges),
+        "ranges": [{"start": format_hhmm(start), "end": format_hhmm(end)} for start, end in ranges],
+    }
 
-@app.get("/profile")
+@app.get("/profile", response_model=ProfileOut)
 def get_profile(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     profile = current_user.profile
     if not profile:
@@ -572,20 +1076,22 @@ def get_profile(db: Session = Depends(get_db), current_user: models.User = Depen
             "bio": "", "avatar_url": "", "monthly_goal": 500000,
             "appointment_interval": 30
         }
-    return profile
+    return columns_of(profile, PROFILE_COLUMNS)
 
-@app.get("/profile/{slug}")
+@app.get("/profile/{slug}", response_model=PublicProfileOut)
 def get_public_profile(slug: str, db: Session = Depends(get_db)):
-    profile = db.query(models.Profile).filter(models.Profile.slug == slug).first()
-    if not profile:
+    row = db.query(*PUBLIC_PROFILE_COLUMNS, models.User.is_active).join(
+        models.User, models.Profile.owner_id == models.User.id
+    ).filter(models.Profile.slug == slug).first()
+    if not row:
         raise HTTPException(status_code=404, detail="Perfil no encontrado")
     
-    if not profile.owner.is_active:
+    if not row.is_active:
         raise HTTPException(status_code=404, detail="Perfil suspendido")
 
-    return profile
+    return row._asdict()
 
-@app.post("/profile")
+@app.post("/profile", response_model=ProfileOut)
 def update_profile(data: ProfileSchema, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     profile = current_user.profile
     if not profile:
@@ -602,9 +1108,9 @@ def update_profile(data: ProfileSchema, db: Session = Depends(get_db), current_u
     
     db.commit()
     db.refresh(profile)
-    return profile
+    return columns_of(profile, PROFILE_COLUMNS)
 
-@app.post("/register")
+@app.post("/register", response_model=MessageOut)
 def register_user(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     user = db.query(models.User).filter(models.User.username == form_data.username).first()
     if user:
@@ -620,7 +1126,7 @@ def register_user(form_data: OAuth2PasswordRequestForm = Depends(), db: Session
     
     return {"message": f"Usuario {new_user.username} creado exitosamente"}
 
-@app.post("/token")
+@app.post("/token", response_model=TokenOut)
 def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     print(f"Intentando loguear a: {form_data.username}") # DEBUG
     user = db.query(models.User).filter(models.User.username == form_data.username).first()
@@ -644,6 +1150,10 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    if user.purge_requested_at is not None:
+        print("RESULTADO: Cuenta en eliminación") # DEBUG
+        raise HTTPException(status_code=403, detail="La cuenta está siendo eliminada")
+
     print("RESULTADO: Login Exitoso. Generando Token.") # DEBUG
     access_token = create_access_token(data={"sub": user.username})
     return {
@@ -652,7 +1162,52 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
         "is_admin": user.is_admin
     }
 
-@app.post("/upload")
+def calendar_token_response(token: str):
+    return {"token": token, "url": f"/calendar/{token}.ics"}
+
+@app.get("/calendar/token", response_model=CalendarTokenOut)
+def get_calendar_token(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    profile = current_user.profile
+    if not profile:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    if not profile.calendar_token:
+        profile.calendar_token = secrets.token_urlsafe(24)
+        db.commit()
+    return calendar_token_response(profile.calendar_token)
+
+@app.post("/calendar/token/rotate", response_model=CalendarTokenOut)
+def rotate_calendar_token(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    profile = current_user.profile
+    if not profile:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    # El token anterior deja de funcionar en este worker de inmediato
+    # y en los demás al vencer su caché de tokens (CALENDAR_CACHE_TTL)
+    profile.calendar_token = secrets.token_urlsafe(24)
+    db.commit()
+    calendar_feed.forget_calendar(current_user.id)
+    return calendar_token_response(profile.calendar_token)
+
+@app.get("/calendar/{token}.ics")
+def get_calendar_feed(
+    token: str,
+    if_none_match: str = Header(None, alias="If-None-Match"),
+    db: Session = Depends(get_db)
+):
+    owner_id = calendar_feed.owner_for_token(db, token)
+    if owner_id is None:
+        raise HTTPException(status_code=404, detail="Calendario no encontrado")
+
+    # La mayoría de los sondeos se responden desde la caché sin tocar la base
+    feed = calendar_feed.cached_feed(owner_id) or calendar_feed.build_feed(db, owner_id)
+    headers = {
+        "ETag": feed.etag,
+        "Cache-Control": f"private, max-age={calendar_feed.CALENDAR_CACHE_TTL}",
+    }
+    if if_none_match and feed.etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=feed.body, media_type="text/calendar; charset=utf-8", headers=headers)
+
+@app.post("/upload", response_model=UploadOut)
 def upload_file(file: UploadFile = File(...), current_user: models.User = Depends(get_current_user)):
     # Generar nombre único
     file_extension = file.filename.split(".")[-1]
@@ -664,32 +1219,48 @@ def upload_file(file: UploadFile = File(...), current_user: models.User = Depend
     # Subir a Supabase
     bucket_name = "Images" 
     try:
-        supabase.storage.from_(bucket_name).upload(file_name, file_content, {"content-type": file.content_type})
+        supabase_provider.call(
+            get_supabase().storage.from_(bucket_name).upload,
+            file_name, file_content, {"content-type": file.content_type}
+        )
+    except IntegrationError as e:
+        print(f"Supabase no disponible: {e}")
+        raise HTTPException(status_code=503, detail="El servicio de imágenes no está disponible, intentá más tarde")
     except Exception as e:
         print(f"Error subiendo a Supabase: {e}")
         raise HTTPException(status_code=500, detail="Error al subir imagen")
 
     # Obtener URL pública
-    public_url = supabase.storage.from_(bucket_name).get_public_url(file_name)
+    public_url = get_supabase().storage.from_(bucket_name).get_public_url(file_name)
     
     return {"url": public_url}
 
-@app.get("/finance/history")
+@app.get("/finance/history", response_model=List[MonthlyHistoryOut])
 def get_finance_history(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
     check_and_close_months(db, current_user.id)
-    return db.query(models.MonthlyHistory).filter(models.MonthlyHistory.owner_id == current_user.id).order_by(models.MonthlyHistory.date_code.desc()).all()
+    rows = db.query(
+        models.MonthlyHistory.id, models.MonthlyHistory.month_label,
+        models.MonthlyHistory.total_earnings, models.MonthlyHistory.total_appointments,
+        models.MonthlyHistory.date_code
+    ).filter(models.MonthlyHistory.owner_id == current_user.id).order_by(models.MonthlyHistory.date_code.desc()).all()
+    return [r._asdict() for r in rows]
 
 def check_and_close_months(db: Session, owner_id: int):
     now = datetime.now()
     first_day_this_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     
-    old_appointments = db.query(models.Appointment).filter(
+    old_appointments = db.query(
+        *APPOINTMENT_COLUMNS,
+        models.Service.name.label("service_name")
+    ).outerjoin(
+        models.Service, models.Appointment.service_id == models.Service.id
+    ).filter(
         models.Appointment.owner_id == owner_id,
         models.Appointment.date_time < first_day_this_month
-    ).all()
+    ).order_by(models.Appointment.date_time.asc()).all()
     
     if not old_appointments:
         return
@@ -700,11 +1271,11 @@ def check_and_close_months(db: Session, owner_id: int):
         if code not in months_to_close:
             months_to_close[code] = {"earnings": 0, "count": 0, "label": apt.date_time.strftime("%B %Y"), "apts": []}
         
-        if apt.status in ['completed', 'concretado']:
+        if apt.status in COMPLETED_STATUSES:
             months_to_close[code]["earnings"] += (apt.price or 0)
             months_to_close[code]["count"] += 1
         
-        months_to_close[code]["apts"].append(apt)
+        months_to_close[code]["apts"].append(apt._asdict())
 
     for code, data in months_to_close.items():
         existing = db.query(models.MonthlyHistory).filter(
@@ -722,32 +1293,145 @@ def check_and_close_months(db: Session, owner_id: int):
             )
             db.add(new_history)
         
-        for apt in data["apts"]:
-            db.delete(apt)
+        # El detalle del mes pasa al archivo comprimido en lugar de perderse
+        archive.store_month(db, owner_id, code, data["apts"])
+
+        if existing:
+            # Turnos cargados tarde en un mes ya cerrado: se suman a los totales.
+            # No se cuentan dos veces porque salen de `appointments` en esta misma
+            # transacción (y el archivo puede no tener el mes completo si se
+            # cerró antes de que existiera).
+            existing.total_earnings = (existing.total_earnings or 0) + data["earnings"]
+            existing.total_appointments = (existing.total_appointments or 0) + data["count"]
     
+    archive.delete_appointments(db, (apt.id for apt in old_appointments))
     db.commit()
+    calendar_feed.invalidate_calendar(owner_id)
+
+@app.get("/finance/archive", response_model=ArchiveQueryOut)
+def get_finance_archive(
+    from_month: str = None,
+    to_month: str = None,
+    service_id: int = None,
+    status: str = None,
+    customer: str = None,
+    limit: int = 500,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    for value in (from_month, to_month):
+        if value:
+            try:
+                datetime.strptime(value, "%Y-%m")
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Formato de mes inválido (YYYY-MM)")
+
+    needle = customer.strip().lower() if customer else None
+
+    months = 0
+    total_matches = 0
+    total_earnings = 0
+    appointments = []
+    for code, columns in archive.scan_archive(db, current_user.id, from_month, to_month):
+        months += 1
+        for row in archive.iter_rows(columns):
+            if service_id is not None and row["service_id"] != service_id:
+                continue
+            if status and row["status"] != status:
+                continue
+            if needle and not any(
+                needle in (row[field] or "").lower()
+                for field in ("customer_name", "customer_email", "customer_phone")
+            ):
+                continue
+            total_matches += 1
+            if row["status"] in COMPLETED_STATUSES:
+                total_earnings += row["price"] or 0
+            if len(appointments) < limit:
+                appointments.append(row)
+
+    return {
+        "months": months,
+        "total_matches": total_matches,
+        "total_earnings": total_earnings,
+        "appointments": appointments,
+    }
+
+def parse_date_range(from_date: str, to_date: str):
+    try:
+        start = datetime.strptime(from_date, "%Y-%m-%d").date() if from_date else None
+        end = datetime.strptime(to_date, "%Y-%m-%d").date() if to_date else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de fecha inválido (YYYY-MM-DD)")
+    return start, end
+
+@app.get("/finance/analytics/services", response_model=List[ServiceAnalyticsOut])
+def get_service_analytics(
+    from_date: str = Query(None, alias="from"),
+    to_date: str = Query(None, alias="to"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    start, end = parse_date_range(from_date, to_date)
+    rollup = models.ServiceDailyRollup
+    query = db.query(
+        rollup.service_id,
+        func.max(rollup.service_name).label("service_name"),
+        func.sum(rollup.completed_count).label("completed"),
+        func.sum(rollup.cancelled_count).label("cancelled"),
+        func.sum(rollup.revenue).label("revenue"),
+    ).filter(rollup.owner_id == current_user.id)
+    if start:
+        query = query.filter(rollup.day >= start)
+    if end:
+        query = query.filter(rollup.day <= end)
+    rows = query.group_by(rollup.service_id).order_by(func.sum(rollup.revenue).desc()).all()
+    return [
+        {
+            "service_id": r.service_id, "service_name": r.service_name,
+            "completed": r.completed or 0, "cancelled": r.cancelled or 0, "revenue": r.revenue or 0,
+        }
+        for r in rows
+    ]
+
+@app.get("/finance/analytics/heatmap", response_model=List[HeatmapCellOut])
+def get_hourly_heatmap(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    rows = db.query(
+        models.HourlyRollup.weekday, models.HourlyRollup.hour,
+        models.HourlyRollup.completed_count, models.HourlyRollup.cancelled_count
+    ).filter(
+        models.HourlyRollup.owner_id == current_user.id
+    ).order_by(models.HourlyRollup.weekday, models.HourlyRollup.hour).all()
+    return [
+        {"weekday": r.weekday, "hour": r.hour, "completed": r.completed_count or 0, "cancelled": r.cancelled_count or 0}
+        for r in rows
+    ]
+
+@app.post("/finance/analytics/rebuild", response_model=RollupRebuildOut)
+def rebuild_analytics(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    return rollups.rebuild_rollups(db, current_user.id)
 
 # --- ENDPOINTS DE ADMINISTRADOR ---
 
 # --- ENDPOINTS DE ADMINISTRADOR ---
 
-@app.get("/admin/users")
+@app.get("/admin/users", response_model=List[AdminUserOut])
 def list_users(db: Session = Depends(get_db), current_admin: models.User = Depends(get_current_admin)):
-    users = db.query(models.User).all()
-    result = []
-    for u in users:
-        result.append({
-            "id": u.id,
-            "username": u.username,
-            "is_admin": u.is_admin,
-            "subscription_active": u.subscription_active,
-            "created_at": u.created_at,
-            "is_active": u.is_active,
-            "profile_name": u.profile.name if u.profile else "Sin Perfil"
-        })
-    return result
+    # Un solo join en lugar de cargar el perfil de cada usuario por separado
+    rows = db.query(
+        models.User.id, models.User.username, models.User.is_admin,
+        models.User.subscription_active, models.User.created_at, models.User.is_active,
+        models.Profile.name.label("profile_name")
+    ).outerjoin(models.Profile, models.Profile.owner_id == models.User.id).all()
+    return [{**r._asdict(), "profile_name": r.profile_name or "Sin Perfil"} for r in rows]
 
-@app.put("/admin/users/{user_id}")
+@app.put("/admin/users/{user_id}", response_model=MessageOut)
 def admin_update_user(
     user_id: int, 
     subscription_active: bool = None,
@@ -758,27 +1442,76 @@ def admin_update_user(
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    if user.purge_requested_at is not None and is_active:
+        raise HTTPException(status_code=409, detail="El usuario está siendo eliminado")
     
     if subscription_active is not None:
         user.subscription_active = subscription_active
+    active_changed = is_active is not None and is_active != user.is_active
     if is_active is not None:
         user.is_active = is_active
         
     db.commit()
+    if active_changed:
+        # El feed .ics de un negocio suspendido deja de servirse en este worker ya
+        calendar_feed.forget_calendar(user.id)
     return {"message": "Usuario actualizado"}
 
-@app.delete("/admin/users/{user_id}")
-def admin_delete_user(user_id: int, db: Session = Depends(get_db), current_admin: models.User = Depends(get_current_admin)):
+@app.delete("/admin/users/{user_id}", response_model=PurgeJobOut, status_code=202)
+def admin_delete_user(
+    user_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_admin: models.User = Depends(get_current_admin)
+):
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
-    
-    # Borrar perfil y datos relacionados 
-    if user.profile: db.delete(user.profile)
-    db.delete(user)
-    db.commit()
-    return {"message": "Usuario eliminado correctamente"}
+    if user.id == current_admin.id:
+        raise HTTPException(status_code=400, detail="No podés eliminar tu propio usuario")
+
+    # Los datos del negocio se borran en segundo plano y por lotes;
+    # se devuelve el job para consultar el avance.
+    job = tenant_purge.active_purge_job(db, user.id)
+    if job is None:
+        job = tenant_purge.create_purge_job(db, user, current_admin.id)
+        background_tasks.add_task(tenant_purge.run_purge_job, job.id)
+    return tenant_purge.purge_job_status(job)
+
+@app.get("/admin/purge-jobs/{job_id}", response_model=PurgeJobOut)
+def admin_purge_job(job_id: str, db: Session = Depends(get_db), current_admin: models.User = Depends(get_current_admin)):
+    job = db.query(models.PurgeJob).filter(models.PurgeJob.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    return tenant_purge.purge_job_status(job)
+
+@app.get("/admin/integrations", response_model=List[IntegrationStatusOut])
+def admin_integrations(current_admin: models.User = Depends(get_current_admin)):
+    # Estado de los circuit breakers y contadores de este worker
+    return integration_status()
+
+@app.get("/admin/profiles", response_model=List[RequestProfileSummaryOut])
+def admin_list_profiles(current_admin: models.User = Depends(get_current_admin)):
+    # Perfiles guardados en este worker, del más reciente al más viejo
+    return profiling.list_profiles()
+
+@app.get("/admin/profiles/{profile_id}", response_model=RequestProfileOut)
+def admin_get_profile(
+    profile_id: str,
+    format: str = "json",
+    current_admin: models.User = Depends(get_current_admin)
+):
+    trace = profiling.get_profile(profile_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    if format == "folded":
+        # Para flamegraph.pl o speedscope
+        return Response(
+            content=trace.folded(), media_type="text/plain; charset=utf-8",
+            headers={"Content-Disposition": f'attachment; filename="perfil-{trace.id}.folded"'}
+        )
+    return trace.as_dict()
 
-@app.api_route("/health", methods=["GET", "HEAD"])
+@app.api_route("/health", methods=["GET", "HEAD"], response_model=StatusOut)
 def health():
     return {"status": "ok"}
\ No newline at end of file
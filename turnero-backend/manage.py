@@ -0,0 +1,246 @@
+"""
+Tareas de administración de la base de datos. Reemplaza a migrate.py y migrate_db.py
+y a las migraciones que antes corrían al importar main.py en cada worker.
+
+Uso:
+    python manage.py migrate      # aplica las migraciones pendientes
+    python manage.py seed-admin   # crea el usuario Administrador si no existe
+    python manage.py status       # lista migraciones aplicadas y pendientes
+    python manage.py backfill-customers  # arma el directorio de clientes desde los turnos
+
+Se corre una vez por deploy, antes de levantar los workers.
+"""
+import argparse
+import os
+import sys
+from contextlib import contextmanager
+from sqlalchemy import inspect, text
+import models
+from database import engine, SessionLocal
+
+# Clave del advisory lock de Postgres que serializa las migraciones entre deploys
+MIGRATION_LOCK_KEY = 7420261
+
+
+def create_all(conn):
+    # checkfirst: solo crea las tablas que faltan
+    models.Base.metadata.create_all(bind=conn)
+
+
+def create_tables(*names):
+    def run(conn):
+        tables = [models.Base.metadata.tables[name] for name in names]
+        models.Base.metadata.create_all(bind=conn, tables=tables)
+    return run
+
+
+def add_columns(table, columns, unique_index=None):
+    def run(conn):
+        existing = {c["name"] for c in inspect(conn).get_columns(table)}
+        for col, typ in columns:
+            if col in existing:
+                continue
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {col} {typ}"))
+            print(f"- Columna '{col}' agregada a '{table}'.")
+        if unique_index:
+            name, col = unique_index
+            conn.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table} ({col})"))
+    return run
+
+
+def create_indexes(table, indexes):
+    """indexes: [(nombre, "columna, columna")]. Los que ya existen se dejan como están."""
+    def run(conn):
+        for name, columns in indexes:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+            print(f"- Índice '{name}' en '{table}'.")
+    return run
+
+
+def customer_terms(conn):
+    """Crea el índice de búsqueda de clientes en la base y lo llena con los existentes."""
+    from customers import customer_terms as terms_for
+
+    create_tables("customer_terms")(conn)
+    rows = conn.execute(text("SELECT id, owner_id, name, email, phone FROM customers")).fetchall()
+    batch = []
+    for cid, owner_id, name, email, phone in rows:
+        batch.extend(
+            {"owner_id": owner_id, "customer_id": cid, "term": term}
+            for term in terms_for(name, email, phone)
+        )
+        if len(batch) >= 5000:
+            conn.execute(models.CustomerTerm.__table__.insert(), batch)
+            batch = []
+    if batch:
+        conn.execute(models.CustomerTerm.__table__.insert(), batch)
+
+
+# (versión, nombre, función). Nunca modificar una migración ya publicada: agregar una nueva.
+MIGRATIONS = [
+    (1, "tablas_faltantes", create_all),
+    (2, "users_admin_y_suscripcion", add_columns("users", [
+        ("is_admin", "BOOLEAN DEFAULT FALSE"),
+        ("subscription_active", "BOOLEAN DEFAULT TRUE"),
+        ("created_at", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"),
+    ])),
+    (3, "appointments_precio_y_contacto", add_columns("appointments", [
+        ("price", "INTEGER"),
+        ("customer_email", "VARCHAR"),
+        ("customer_phone", "VARCHAR"),
+    ])),
+    (4, "profile_appointment_interval", add_columns("profile", [
+        ("appointment_interval", "INTEGER DEFAULT 30"),
+    ])),
+    (5, "schedules_minutos", add_columns("schedules", [
+        ("weekday", "INTEGER"),
+        ("start_minute", "INTEGER"),
+        ("end_minute", "INTEGER"),
+    ])),
+    (6, "appointments_staff", add_columns("appointments", [
+        ("staff_id", "INTEGER REFERENCES staff(id)"),
+    ])),
+    (7, "customers", create_tables("customers")),
+    (8, "appointments_customer", add_columns("appointments", [
+        ("customer_id", "INTEGER REFERENCES customers(id)"),
+    ])),
+    (9, "appointments_series", add_columns("appointments", [
+        ("series_id", "VARCHAR"),
+    ])),
+    (10, "profile_calendar_token", add_columns("profile", [
+        ("calendar_token", "VARCHAR"),
+    ], unique_index=("ix_profile_calendar_token", "calendar_token"))),
+    (11, "purge_jobs", create_tables("purge_jobs")),
+    (12, "customer_terms", customer_terms),
+    # Las migraciones 6, 8 y 9 agregaron las columnas sin los índices que declara el modelo
+    (13, "appointments_indices", create_indexes("appointments", [
+        ("ix_appointments_staff_id", "staff_id"),
+        ("ix_appointments_customer_id", "customer_id"),
+        ("ix_appointments_series_id", "series_id"),
+    ])),
+    (14, "appointments_owner_date", create_indexes("appointments", [
+        ("ix_appointments_owner_date", "owner_id, date_time"),
+    ])),
+    (15, "users_purge_requested_at", add_columns("users", [
+        ("purge_requested_at", "TIMESTAMP"),
+    ])),
+    (16, "idempotency_keys", create_tables("idempotency_keys")),
+]
+
+
+@contextmanager
+def migration_lock(conn):
+    """Evita que dos deploys migren a la vez. Solo Postgres tiene advisory locks."""
+    if conn.dialect.name != "postgresql":
+        yield
+        return
+    conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+    try:
+        yield
+    finally:
+        conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+
+def ensure_migrations_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name VARCHAR, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    ))
+    conn.commit()
+
+
+def applied_versions(conn):
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def migrate():
+    with engine.connect() as conn:
+        with migration_lock(conn):
+            ensure_migrations_table(conn)
+            done = applied_versions(conn)
+            conn.commit()
+            pending = [m for m in MIGRATIONS if m[0] not in done]
+            if not pending:
+                print("La base de datos ya está al día.")
+                return
+            for version, name, run in pending:
+                print(f"Aplicando migración {version:04d} {name}...")
+                # Cada migración y su registro van en la misma transacción
+                with conn.begin():
+                    run(conn)
+                    conn.execute(
+                        text("INSERT INTO schema_migrations (version, name) VALUES (:v, :n)"),
+                        {"v": version, "n": name}
+                    )
+            print("Migración completada.")
+
+
+def status():
+    with engine.connect() as conn:
+        ensure_migrations_table(conn)
+        done = applied_versions(conn)
+    for version, name, _ in MIGRATIONS:
+        mark = "x" if version in done else " "
+        print(f"[{mark}] {version:04d} {name}")
+
+
+def seed_admin():
+    # Import diferido: solo este comando necesita el hash de contraseñas
+    from main import get_password_hash
+
+    password = os.getenv("HASH_PWW")
+    if not password:
+        print("ERROR: HASH_PWW no está configurado.")
+        sys.exit(1)
+
+    db = SessionLocal()
+    try:
+        admin_username = "Administrador"
+        existing_admin = db.query(models.User).filter(models.User.username == admin_username).first()
+        if existing_admin:
+            print("El usuario Administrador ya existe.")
+            return
+        print("Creando usuario Administrador inicial...")
+        db.add(models.User(
+            username=admin_username,
+            hashed_password=get_password_hash(password),
+            is_admin=True,
+            subscription_active=True
+        ))
+        db.commit()
+        print("Usuario Administrador creado.")
+    finally:
+        db.close()
+
+
+def backfill_customers():
+    from customers import backfill_customers as backfill
+
+    db = SessionLocal()
+    try:
+        owner_ids = [row[0] for row in db.query(models.User.id).order_by(models.User.id)]
+        for owner_id in owner_ids:
+            total = backfill(db, owner_id)
+            print(f"- Negocio {owner_id}: {total} clientes.")
+        print("Directorio de clientes actualizado.")
+    finally:
+        db.close()
+
+
+COMMANDS = {
+    "migrate": migrate,
+    "seed-admin": seed_admin,
+    "status": status,
+    "backfill-customers": backfill_customers,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Administración del backend de turnos")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    args = parser.parse_args(argv)
+    COMMANDS[args.command]()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,16 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Date, Table, LargeBinary, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
 
+# Qué profesionales pueden realizar cada servicio
+service_staff = Table(
+    "service_staff",
+    Base.metadata,
+    Column("service_id", Integer, ForeignKey("services.id"), primary_key=True),
+    Column("staff_id", Integer, ForeignKey("staff.id"), primary_key=True),
+)
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -12,11 +20,19 @@ class User(Base):
     subscription_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+    # Marcado al pedir el borrado del negocio (ver tenant_purge.py): bloquea el acceso al panel
+    purge_requested_at = Column(DateTime, nullable=True)
     profile = relationship("Profile", back_populates="owner", uselist=False)
     services = relationship("Service", back_populates="owner")
     appointments = relationship("Appointment", back_populates="owner")
     schedules = relationship("Schedule", back_populates="owner")
+    schedule_overrides = relationship("ScheduleOverride", back_populates="owner")
     monthly_history = relationship("MonthlyHistory", back_populates="owner")
+    staff = relationship("Staff", back_populates="owner")
+    appointment_archives = relationship("AppointmentArchive", back_populates="owner")
+    service_daily_rollups = relationship("ServiceDailyRollup", back_populates="owner")
+    hourly_rollups = relationship("HourlyRollup", back_populates="owner")
+    customers = relationship("Customer", back_populates="owner")
 
 class Profile(Base):
     __tablename__ = "profile"
@@ -30,6 +46,7 @@ class Profile(Base):
     avatar_url = Column(String)
     monthly_goal = Column(Integer, default=500000)
     appointment_interval = Column(Integer, default=30)
+    calendar_token = Column(String, unique=True, index=True) # Acceso al feed .ics sin login
     
     owner = relationship("User", back_populates="profile")
 
@@ -44,12 +61,30 @@ class Service(Base):
     
     owner = relationship("User", back_populates="services")
     appointments = relationship("Appointment", back_populates="service")
+    staff = relationship("Staff", secondary=service_staff, back_populates="services")
+
+class Staff(Base):
+    __tablename__ = "staff"
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
+    
+    name = Column(String)
+    is_active = Column(Boolean, default=True)
+    
+    owner = relationship("User", back_populates="staff")
+    services = relationship("Service", secondary=service_staff, back_populates="staff")
+    appointments = relationship("Appointment", back_populates="staff")
 
 class Appointment(Base):
     __tablename__ = "appointments"
+    # Consultas por negocio y rango de fechas (agenda, disponibilidad, calendario)
+    __table_args__ = (Index("ix_appointments_owner_date", "owner_id", "date_time"),)
     id = Column(Integer, primary_key=True, index=True)
     owner_id = Column(Integer, ForeignKey("users.id"))
     service_id = Column(Integer, ForeignKey("services.id"))
+    staff_id = Column(Integer, ForeignKey("staff.id"), nullable=True, index=True)
+    customer_id = Column(Integer, ForeignKey("customers.id"), nullable=True, index=True)
+    series_id = Column(String, nullable=True, index=True) # Turnos creados juntos como serie recurrente
     
     customer_name = Column(String)
     customer_email = Column(String)
@@ -60,6 +95,8 @@ class Appointment(Base):
     
     owner = relationship("User", back_populates="appointments")
     service = relationship("Service", back_populates="appointments")
+    staff = relationship("Staff", back_populates="appointments")
+    customer = relationship("Customer", back_populates="appointments")
 
 class Schedule(Base):
     __tablename__ = "schedules"
@@ -70,9 +107,26 @@ class Schedule(Base):
     is_open = Column(Boolean, default=True)
     start_time = Column(String)
     end_time = Column(String)
+    # Versión compilada de los campos de texto (0 = lunes, minutos desde las 00:00)
+    weekday = Column(Integer)
+    start_minute = Column(Integer)
+    end_minute = Column(Integer)
     
     owner = relationship("User", back_populates="schedules")
 
+class ScheduleOverride(Base):
+    __tablename__ = "schedule_overrides"
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
+    
+    date = Column(Date, index=True) # Ejemplo: feriado o día con horario extendido
+    is_open = Column(Boolean, default=False)
+    start_minute = Column(Integer)
+    end_minute = Column(Integer)
+    note = Column(String)
+    
+    owner = relationship("User", back_populates="schedule_overrides")
+
 class MonthlyHistory(Base):
     __tablename__ = "monthly_history"
     id = Column(Integer, primary_key=True, index=True)
@@ -83,4 +137,102 @@ class MonthlyHistory(Base):
     total_appointments = Column(Integer)
     date_code = Column(String) # Ejemplo: "2026-02" para evitar duplicados
     
-    owner = relationship("User", back_populates="monthly_history")
\ No newline at end of file
+    owner = relationship("User", back_populates="monthly_history")
+
+class AppointmentArchive(Base):
+    __tablename__ = "appointment_archives"
+    __table_args__ = (UniqueConstraint("owner_id", "date_code"),)
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
+    
+    date_code = Column(String, index=True) # Ejemplo: "2026-02"
+    row_count = Column(Integer, default=0)
+    payload = Column(LargeBinary) # Turnos del mes en columnas, comprimidos (ver archive.py)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    owner = relationship("User", back_populates="appointment_archives")
+
+class ServiceDailyRollup(Base):
+    __tablename__ = "service_daily_rollups"
+    __table_args__ = (UniqueConstraint("owner_id", "day", "service_id"),)
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
+    
+    day = Column(Date)
+    service_id = Column(Integer) # Sin FK: el resumen sobrevive a servicios eliminados
+    service_name = Column(String)
+    completed_count = Column(Integer, default=0)
+    cancelled_count = Column(Integer, default=0)
+    revenue = Column(Integer, default=0)
+    
+    owner = relationship("User", back_populates="service_daily_rollups")
+
+class HourlyRollup(Base):
+    __tablename__ = "hourly_rollups"
+    __table_args__ = (UniqueConstraint("owner_id", "weekday", "hour"),)
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
+    
+    weekday = Column(Integer) # 0 = lunes
+    hour = Column(Integer)
+    completed_count = Column(Integer, default=0)
+    cancelled_count = Column(Integer, default=0)
+    
+    owner = relationship("User", back_populates="hourly_rollups")
+
+class Customer(Base):
+    __tablename__ = "customers"
+    __table_args__ = (
+        UniqueConstraint("owner_id", "email_norm"),
+        UniqueConstraint("owner_id", "phone_norm"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
+    
+    name = Column(String)
+    email = Column(String)
+    phone = Column(String)
+    # Claves de deduplicación: email en minúsculas y teléfono solo con dígitos
+    email_norm = Column(String)
+    phone_norm = Column(String)
+    visits = Column(Integer, default=0)
+    first_seen_at = Column(DateTime)
+    last_seen_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    owner = relationship("User", back_populates="customers")
+    appointments = relationship("Appointment", back_populates="customer")
+
+class CustomerTerm(Base):
+    # Índice de búsqueda por prefijo del directorio de clientes (ver customers.find_customers)
+    __tablename__ = "customer_terms"
+    __table_args__ = (Index("ix_customer_terms_owner_term", "owner_id", "term"),)
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id"))
+    customer_id = Column(Integer, ForeignKey("customers.id"), index=True)
+    
+    # Intercalación "C" en Postgres: el orden del índice es byte a byte y un
+    # prefijo es un rango contiguo
+    term = Column(String().with_variant(String(collation="C"), "postgresql"))
+
+class PurgeJob(Base):
+    __tablename__ = "purge_jobs"
+    id = Column(String, primary_key=True) # uuid, se devuelve al admin para consultar el avance
+    owner_id = Column(Integer, index=True) # Sin FK: el usuario se borra al final del job
+    requested_by = Column(Integer)
+    
+    status = Column(String, default="pending") # pending, running, done, failed
+    current_step = Column(String)
+    deleted_rows = Column(Integer, default=0)
+    error = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime)
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    key = Column(String, primary_key=True) # Header Idempotency-Key que manda el cliente
+    fingerprint = Column(String)
+    status_code = Column(Integer) # None mientras el intento original está en curso
+    body = Column(String) # JSON de la respuesta a repetir
+    expires_at = Column(DateTime, index=True)
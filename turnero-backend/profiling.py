@@ -0,0 +1,301 @@
+"""
+Perfilado a pedido de un request puntual, solo para administradores.
+
+Un admin agrega el header `X-Profile: 1` (o `?_profile=1`) a cualquier request
+autenticado con su token. Mientras dura ese request se registran:
+- muestras periódicas de la pila de los threads que lo atienden (perfil de CPU
+  por muestreo, exportable en formato "folded" para flamegraphs);
+- cada sentencia SQL con su duración y filas afectadas (sin parámetros, que
+  pueden traer datos de clientes).
+
+El resultado queda en un buffer circular en memoria del worker y se consulta
+en /admin/profiles. Sin el header el middleware solo mira los headers: los
+listeners de SQLAlchemy, el envoltorio de `anyio.to_thread.run_sync` y el
+thread de muestreo existen únicamente mientras hay un request perfilado en curso.
+
+Se muestrean dos clases de threads:
+- los del threadpool, desde que empiezan a correr código del request (endpoint
+  o dependencia sincrónica) hasta que terminan, vía `anyio.to_thread.run_sync`;
+- el thread del event loop, donde FastAPI valida y serializa la respuesta. Lo
+  comparten todos los requests del worker, así que con tráfico concurrente sus
+  muestras pueden incluir trabajo de otros requests; las del loop ocioso
+  (esperando en el selector) se descartan.
+"""
+import contextvars
+import functools
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime
+from sqlalchemy import event
+from urllib.parse import parse_qsl
+import anyio.to_thread
+from starlette.concurrency import run_in_threadpool
+
+# Cantidad de perfiles guardados por worker; al superarla se descartan los más viejos
+PROFILE_BUFFER_SIZE = 50
+# Intervalo entre muestras de pila (segundos)
+PROFILE_SAMPLE_INTERVAL = 0.005
+# Tope de sentencias SQL registradas por request
+PROFILE_MAX_QUERIES = 5000
+PROFILE_MAX_STACK_DEPTH = 64
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_QUERY_PARAM = "_profile"
+PROFILE_TRUE_VALUES = ("1", "true", "yes", "on")
+
+# Marco más interno del event loop cuando está ocioso esperando eventos
+# (asyncio puro, o uvloop donde el loop no tiene marcos de Python)
+LOOP_IDLE_FRAMES = ("selectors.py:select", "base_events.py:run_forever", "runners.py:run")
+
+_current = contextvars.ContextVar("profiling_trace", default=None)
+_profiles = deque(maxlen=PROFILE_BUFFER_SIZE)
+_profiles_lock = threading.Lock()
+
+# thread del threadpool -> trace cuyo código está corriendo en este momento
+_claims = {}
+_active = 0
+_active_lock = threading.Lock()
+_original_run_sync = anyio.to_thread.run_sync
+
+
+class RequestTrace:
+    def __init__(self, method: str, path: str, query: str, user_id: int, loop_thread: int):
+        self.id = uuid.uuid4().hex[:12]
+        self.loop_thread = loop_thread
+        self.method = method
+        self.path = path
+        self.query = query
+        self.user_id = user_id
+        self.started_at = datetime.utcnow()
+        self.status = None
+        self.queries = []
+        self.dropped_queries = 0
+        self.stacks = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._started = time.perf_counter()
+        self.duration_ms = None
+
+    def add_query(self, statement: str, duration_ms: float, rows, executemany: bool):
+        if len(self.queries) >= PROFILE_MAX_QUERIES:
+            self.dropped_queries += 1
+            return
+        self.queries.append({
+            "statement": statement,
+            "duration_ms": round(duration_ms, 3),
+            "rows": rows,
+            "executemany": executemany,
+        })
+
+    def _sample(self):
+        last = time.perf_counter()
+        while not self._stop.wait(PROFILE_SAMPLE_INTERVAL):
+            # Código en C que no suelta el GIL (pydantic-core, orjson, el driver)
+            # demora la muestra siguiente: cada pila pesa el tiempo realmente
+            # transcurrido, medido en intervalos, para no subestimar ese código
+            now = time.perf_counter()
+            weight = max(1, round((now - last) / PROFILE_SAMPLE_INTERVAL))
+            last = now
+            threads = [tid for tid, trace in list(_claims.items()) if trace is self]
+            threads.append(self.loop_thread)
+            frames = sys._current_frames()
+            for tid in threads:
+                frame = frames.get(tid)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < PROFILE_MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if tid == self.loop_thread and stack[0] in LOOP_IDLE_FRAMES:
+                    continue
+                self.stacks[";".join(reversed(stack))] += weight
+                self.sample_count += weight
+
+    def start(self):
+        threading.Thread(target=self._sample, name=f"profile-{self.id}", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        self.duration_ms = round((time.perf_counter() - self._started) * 1000, 1)
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "query": self.query,
+            "status": self.status,
+            "user_id": self.user_id,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "sample_count": self.sample_count,
+            "sql_count": len(self.queries) + self.dropped_queries,
+            "sql_time_ms": round(sum(q["duration_ms"] for q in self.queries), 1),
+        }
+
+    def as_dict(self) -> dict:
+        data = self.summary()
+        data.update(
+            sample_interval_ms=PROFILE_SAMPLE_INTERVAL * 1000,
+            stacks=[{"stack": stack, "samples": n} for stack, n in self.stacks.most_common()],
+            sql=list(self.queries),
+            dropped_queries=self.dropped_queries,
+        )
+        return data
+
+    def folded(self) -> str:
+        """Formato de flamegraph.pl / speedscope: "marco;marco;marco muestras" por línea."""
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is None:
+        return
+    conn.info.setdefault("profiling_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _current.get()
+    if trace is None:
+        return
+    pending = conn.info.get("profiling_started")
+    if not pending:
+        return  # la consulta empezó antes de activar los listeners
+    started = pending.pop()
+    rows = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None
+    trace.add_query(statement, (time.perf_counter() - started) * 1000, rows, executemany)
+
+
+def _run_claimed(trace, func, *args):
+    # Corre en el thread del pool: queda asociado al trace mientras dura la llamada
+    tid = threading.get_ident()
+    _claims[tid] = trace
+    try:
+        return func(*args)
+    finally:
+        _claims.pop(tid, None)
+
+
+async def _run_sync(func, *args, **kwargs):
+    # Starlette y FastAPI mandan al threadpool todo el código sincrónico
+    # (endpoints, dependencias) a través de anyio.to_thread.run_sync
+    trace = _current.get()
+    if trace is not None:
+        func = functools.partial(_run_claimed, trace, func)
+    return await _original_run_sync(func, *args, **kwargs)
+
+
+def _activate(engine):
+    global _active
+    with _active_lock:
+        _active += 1
+        if _active == 1:
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+            anyio.to_thread.run_sync = _run_sync
+
+
+def _deactivate(engine):
+    global _active
+    with _active_lock:
+        _active -= 1
+        if _active == 0:
+            event.remove(engine, "before_cursor_execute", _before_cursor_execute)
+            event.remove(engine, "after_cursor_execute", _after_cursor_execute)
+            anyio.to_thread.run_sync = _original_run_sync
+            _claims.clear()
+
+
+def _truthy(value: str) -> bool:
+    return value.strip().lower() in PROFILE_TRUE_VALUES
+
+
+def _requested(scope) -> bool:
+    for name, value in scope.get("headers", ()):
+        if name == PROFILE_HEADER and _truthy(value.decode("latin-1")):
+            return True
+    query_string = scope.get("query_string", b"")
+    # Chequeo barato antes de parsear: la gran mayoría de los requests no lo trae
+    if PROFILE_QUERY_PARAM.encode() not in query_string:
+        return False
+    return any(
+        name == PROFILE_QUERY_PARAM and _truthy(value)
+        for name, value in parse_qsl(query_string.decode("latin-1"))
+    )
+
+
+def _bearer_token(scope):
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return token.strip() if scheme.lower() == "bearer" and token else None
+    return None
+
+
+class ProfilingMiddleware:
+    """
+    Middleware ASGI puro. `authorize(token)` devuelve el id del admin dueño del
+    token o None; corre en el threadpool porque consulta la base. Si quien pide
+    el perfil no es admin, el request se atiende normalmente sin perfilar.
+    """
+
+    def __init__(self, app, engine, authorize):
+        self.app = app
+        self.engine = engine
+        self.authorize = authorize
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        token = _bearer_token(scope)
+        user_id = await run_in_threadpool(self.authorize, token) if token else None
+        if user_id is None:
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(
+            scope["method"], scope["path"], scope.get("query_string", b"").decode("latin-1"), user_id,
+            threading.get_ident()
+        )
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", trace.id.encode())]
+            await send(message)
+
+        _activate(self.engine)
+        token_var = _current.set(trace)
+        trace.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            trace.stop()
+            _current.reset(token_var)
+            _deactivate(self.engine)
+            with _profiles_lock:
+                _profiles.append(trace)
+            print(f"Perfil {trace.id}: {trace.method} {trace.path} en {trace.duration_ms} ms, "
+                  f"{len(trace.queries)} consultas SQL, {trace.sample_count} muestras.")
+
+
+def list_profiles():
+    with _profiles_lock:
+        traces = list(_profiles)
+    return [trace.summary() for trace in reversed(traces)]
+
+
+def get_profile(profile_id: str):
+    with _profiles_lock:
+        for trace in _profiles:
+            if trace.id == profile_id:
+                return trace
+    return None
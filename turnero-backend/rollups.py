@@ -0,0 +1,128 @@
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import models
+import archive
+
+COMPLETED_STATUSES = ('completed', 'concretado')
+CANCELLED_STATUS = 'cancelled'
+
+
+def status_bucket(status):
+    if status in COMPLETED_STATUSES:
+        return "completed"
+    if status == CANCELLED_STATUS:
+        return "cancelled"
+    return None
+
+
+def _increment(db: Session, model, keys: dict, deltas: dict, extra: dict = None):
+    """
+    Suma `deltas` a la fila identificada por `keys` con un UPDATE atómico;
+    si todavía no existe la crea. No hace commit.
+    """
+    query = db.query(model).filter_by(**keys)
+    values = {getattr(model, col): getattr(model, col) + delta for col, delta in deltas.items()}
+    if extra:
+        values.update({getattr(model, col): value for col, value in extra.items()})
+    if query.update(values, synchronize_session=False):
+        return
+    try:
+        with db.begin_nested():
+            db.add(model(**keys, **deltas, **(extra or {})))
+    except IntegrityError:
+        # Otra request creó la fila al mismo tiempo
+        query.update(values, synchronize_session=False)
+
+
+def _bump(db: Session, owner_id: int, service_id: int, service_name: str, date_time: datetime, price: int, bucket: str, sign: int):
+    deltas = {f"{bucket}_count": sign}
+    if bucket == "completed":
+        deltas["revenue"] = sign * (price or 0)
+    _increment(
+        db, models.ServiceDailyRollup,
+        {"owner_id": owner_id, "day": date_time.date(), "service_id": service_id},
+        deltas,
+        {"service_name": service_name} if service_name else None,
+    )
+    _increment(
+        db, models.HourlyRollup,
+        {"owner_id": owner_id, "weekday": date_time.weekday(), "hour": date_time.hour},
+        {f"{bucket}_count": sign},
+    )
+
+
+def apply_status_change(db: Session, appointment: models.Appointment, old_status: str, new_status: str):
+    """Actualiza los resúmenes cuando un turno cambia de estado (no hace commit)."""
+    old_bucket = status_bucket(old_status)
+    new_bucket = status_bucket(new_status)
+    if old_bucket == new_bucket or appointment.date_time is None:
+        return
+    service_name = appointment.service.name if appointment.service else None
+    for bucket, sign in ((old_bucket, -1), (new_bucket, 1)):
+        if bucket:
+            _bump(
+                db, appointment.owner_id, appointment.service_id, service_name,
+                appointment.date_time, appointment.price, bucket, sign
+            )
+
+
+def rebuild_rollups(db: Session, owner_id: int):
+    """
+    Recalcula los resúmenes de un negocio a partir de los turnos vivos y del archivo.
+    Los turnos cancelados se eliminan de la tabla, así que los contadores de
+    cancelación ya acumulados se conservan en lugar de recalcularse.
+    """
+    daily = defaultdict(lambda: {"completed_count": 0, "cancelled_count": 0, "revenue": 0, "service_name": None})
+    hourly = defaultdict(lambda: {"completed_count": 0, "cancelled_count": 0})
+
+    for day, service_id, service_name, cancelled in db.query(
+        models.ServiceDailyRollup.day, models.ServiceDailyRollup.service_id,
+        models.ServiceDailyRollup.service_name, models.ServiceDailyRollup.cancelled_count
+    ).filter(models.ServiceDailyRollup.owner_id == owner_id):
+        entry = daily[(day, service_id)]
+        entry["cancelled_count"] = cancelled or 0
+        entry["service_name"] = service_name
+    for weekday, hour, cancelled in db.query(
+        models.HourlyRollup.weekday, models.HourlyRollup.hour, models.HourlyRollup.cancelled_count
+    ).filter(models.HourlyRollup.owner_id == owner_id):
+        hourly[(weekday, hour)]["cancelled_count"] = cancelled or 0
+
+    def add(date_time, service_id, service_name, price, status):
+        if date_time is None or status not in COMPLETED_STATUSES:
+            return
+        entry = daily[(date_time.date(), service_id)]
+        entry["completed_count"] += 1
+        entry["revenue"] += price or 0
+        entry["service_name"] = service_name or entry["service_name"]
+        hourly[(date_time.weekday(), date_time.hour)]["completed_count"] += 1
+
+    live = db.query(
+        models.Appointment.date_time, models.Appointment.service_id,
+        models.Service.name, models.Appointment.price, models.Appointment.status
+    ).outerjoin(
+        models.Service, models.Appointment.service_id == models.Service.id
+    ).filter(models.Appointment.owner_id == owner_id)
+    for row in live.yield_per(1000):
+        add(*row)
+    for _, columns in archive.scan_archive(db, owner_id):
+        for row in archive.iter_rows(columns):
+            add(row["date_time"], row["service_id"], row["service_name"], row["price"], row["status"])
+
+    db.query(models.ServiceDailyRollup).filter(
+        models.ServiceDailyRollup.owner_id == owner_id
+    ).delete(synchronize_session=False)
+    db.query(models.HourlyRollup).filter(
+        models.HourlyRollup.owner_id == owner_id
+    ).delete(synchronize_session=False)
+    db.bulk_insert_mappings(models.ServiceDailyRollup, [
+        {"owner_id": owner_id, "day": day, "service_id": service_id, **values}
+        for (day, service_id), values in daily.items()
+    ])
+    db.bulk_insert_mappings(models.HourlyRollup, [
+        {"owner_id": owner_id, "weekday": weekday, "hour": hour, **values}
+        for (weekday, hour), values in hourly.items()
+    ])
+    db.commit()
+    return {"daily_rows": len(daily), "hourly_rows": len(hourly)}
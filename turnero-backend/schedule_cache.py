@@ -0,0 +1,198 @@
+import threading
+import time
+import unicodedata
+from datetime import date, datetime, timedelta
+from sqlalchemy.orm import Session
+import models
+
+MINUTES_PER_DAY = 24 * 60
+
+# Segundos que una agenda compilada sigue siendo válida en este worker.
+# Las modificaciones hechas desde este mismo proceso la invalidan al instante.
+SCHEDULE_CACHE_TTL = 300
+
+# Nombres aceptados para `day_of_week` (0 = lunes, como datetime.weekday())
+DAY_NAMES = {
+    "lunes": 0, "martes": 1, "miercoles": 2, "jueves": 3,
+    "viernes": 4, "sabado": 5, "domingo": 6,
+    "monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3,
+    "friday": 4, "saturday": 5, "sunday": 6,
+}
+
+
+def _strip_accents(value: str) -> str:
+    return "".join(
+        c for c in unicodedata.normalize("NFKD", value) if not unicodedata.combining(c)
+    )
+
+
+def parse_day_of_week(value):
+    """
+    Convierte el texto de `day_of_week` a un índice 0-6 (lunes = 0).
+    Los valores numéricos siguen la convención de JavaScript (0 = domingo).
+    """
+    if value is None:
+        return None
+    key = _strip_accents(str(value)).strip().lower()
+    if key.isdigit():
+        return (int(key) - 1) % 7
+    return DAY_NAMES.get(key)
+
+
+def parse_hhmm(value):
+    """Convierte "HH:MM" en minutos desde las 00:00. Devuelve None si no es válido."""
+    if not value:
+        return None
+    try:
+        hours, minutes = str(value).strip().split(":")[:2]
+        total = int(hours) * 60 + int(minutes)
+    except ValueError:
+        return None
+    if total < 0 or total > MINUTES_PER_DAY:
+        return None
+    return total
+
+
+def format_hhmm(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def normalize_range(start, end):
+    """(inicio, fin) en minutos, o None si el rango está vacío o invertido."""
+    # "00:00" como cierre significa medianoche
+    if end == 0:
+        end = MINUTES_PER_DAY
+    if start is None or end is None or end <= start:
+        return None
+    return (start, end)
+
+
+def _merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return tuple(merged)
+
+
+class CompiledSchedule:
+    """
+    Agenda de un negocio ya procesada: rangos semanales y excepciones por fecha
+    en minutos, listos para consultar sin recorrer filas.
+    """
+    __slots__ = ("weekly", "overrides", "compiled_at")
+
+    def __init__(self, weekly, overrides):
+        self.weekly = weekly            # tupla de 7 tuplas de (inicio, fin)
+        self.overrides = overrides      # {date: tupla de (inicio, fin)}; vacía = cerrado
+        self.compiled_at = time.monotonic()
+
+    def ranges_for(self, day: date):
+        ranges = self.overrides.get(day)
+        if ranges is not None:
+            return ranges
+        return self.weekly[day.weekday()]
+
+    def covers(self, day: date, start_minute: int, end_minute: int) -> bool:
+        """Indica si el intervalo [inicio, fin) cae completo dentro de un rango abierto."""
+        for start, end in self.ranges_for(day):
+            if start <= start_minute and end_minute <= end:
+                return True
+        return False
+
+    def is_configured(self) -> bool:
+        """Sin horarios ni excepciones cargados no se restringe ningún turno."""
+        return any(self.weekly) or bool(self.overrides)
+
+    def accepts(self, start: datetime, minutes: int) -> bool:
+        """Indica si un turno de `minutes` minutos desde `start` cae dentro del horario."""
+        if not self.is_configured():
+            return True
+        start_minute = start.hour * 60 + start.minute
+        return self.covers(start.date(), start_minute, start_minute + minutes)
+
+    def slot_starts(self, first_day: date, last_day: date, step: int, duration: int):
+        """
+        Inicios posibles de turnos entre dos fechas (la última excluida), en orden:
+        cada `step` minutos desde el comienzo de cada rango abierto, mientras el
+        turno de `duration` minutos entre completo en el rango.
+        """
+        step = max(step, 1)
+        day = first_day
+        while day < last_day:
+            midnight = datetime.combine(day, datetime.min.time())
+            for start, end in self.ranges_for(day):
+                minute = start
+                while minute + duration <= end:
+                    yield midnight + timedelta(minutes=minute)
+                    minute += step
+            day += timedelta(days=1)
+
+
+def compile_schedule(schedule_rows, override_rows) -> CompiledSchedule:
+    """
+    schedule_rows: (day_of_week, is_open, start_time, end_time, weekday, start_minute, end_minute)
+    override_rows: (date, is_open, start_minute, end_minute)
+    """
+    weekly = [[] for _ in range(7)]
+    for day_name, is_open, start_time, end_time, weekday, start_minute, end_minute in schedule_rows:
+        if not is_open:
+            continue
+        # Filas anteriores a la compilación solo tienen los campos de texto
+        if weekday is None:
+            weekday = parse_day_of_week(day_name)
+        if start_minute is None:
+            start_minute = parse_hhmm(start_time)
+        if end_minute is None:
+            end_minute = parse_hhmm(end_time)
+        rng = normalize_range(start_minute, end_minute)
+        if weekday is None or rng is None:
+            continue
+        weekly[weekday].append(rng)
+
+    overrides = {}
+    for day, is_open, start_minute, end_minute in override_rows:
+        ranges = overrides.setdefault(day, [])
+        if is_open:
+            rng = normalize_range(start_minute, end_minute)
+            if rng:
+                ranges.append(rng)
+
+    return CompiledSchedule(
+        tuple(_merge_ranges(r) for r in weekly),
+        {day: _merge_ranges(r) for day, r in overrides.items()},
+    )
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def load_compiled_schedule(db: Session, owner_id: int) -> CompiledSchedule:
+    schedule_rows = db.query(
+        models.Schedule.day_of_week, models.Schedule.is_open,
+        models.Schedule.start_time, models.Schedule.end_time,
+        models.Schedule.weekday, models.Schedule.start_minute, models.Schedule.end_minute,
+    ).filter(models.Schedule.owner_id == owner_id).all()
+    override_rows = db.query(
+        models.ScheduleOverride.date, models.ScheduleOverride.is_open,
+        models.ScheduleOverride.start_minute, models.ScheduleOverride.end_minute,
+    ).filter(models.ScheduleOverride.owner_id == owner_id).all()
+    return compile_schedule(schedule_rows, override_rows)
+
+
+def get_compiled_schedule(db: Session, owner_id: int) -> CompiledSchedule:
+    compiled = _cache.get(owner_id)
+    if compiled is not None and time.monotonic() - compiled.compiled_at < SCHEDULE_CACHE_TTL:
+        return compiled
+    compiled = load_compiled_schedule(db, owner_id)
+    with _cache_lock:
+        _cache[owner_id] = compiled
+    return compiled
+
+
+def invalidate_schedule(owner_id: int):
+    with _cache_lock:
+        _cache.pop(owner_id, None)
@@ -0,0 +1,253 @@
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel, Field
+
+# --- ENTRADA ---
+
+class ScheduleSchema(BaseModel):
+    day_of_week: str
+    is_open: bool
+    start_time: str
+    end_time: str
+
+class ScheduleOverrideSchema(BaseModel):
+    date: str
+    is_open: bool
+    start_time: str = None
+    end_time: str = None
+    note: str = None
+
+class AppointmentSeriesSchema(BaseModel):
+    customer_name: str
+    service_id: int
+    start: str  # Primer turno, ISO (ej. "2026-03-02T10:00")
+    interval_weeks: int = Field(1, ge=1)
+    until: str = None  # Último día posible (YYYY-MM-DD)
+    count: int = Field(None, ge=1)  # O cantidad de turnos
+    customer_email: str = None
+    customer_phone: str = None
+
+class ProfileSchema(BaseModel):
+    name: str
+    slug: str
+    specialty: str
+    bio: str
+    avatar_url: str
+    monthly_goal: int
+    appointment_interval: int
+
+# --- RESPUESTAS ---
+# Solo exponen las columnas que usa el frontend (sin owner_id ni datos internos)
+
+class MessageOut(BaseModel):
+    message: str
+
+class StatusOut(BaseModel):
+    status: str
+
+class ServiceOut(BaseModel):
+    id: int
+    name: Optional[str] = None
+    price: Optional[int] = None
+    duration: Optional[int] = None
+
+class StaffOut(BaseModel):
+    id: int
+    name: Optional[str] = None
+    is_active: Optional[bool] = None
+
+class AppointmentOut(BaseModel):
+    id: int
+    service_id: Optional[int] = None
+    staff_id: Optional[int] = None
+    customer_id: Optional[int] = None
+    customer_name: Optional[str] = None
+    customer_email: Optional[str] = None
+    customer_phone: Optional[str] = None
+    date_time: Optional[datetime] = None
+    price: Optional[int] = None
+    status: Optional[str] = None
+    service_name: Optional[str] = None
+
+class SeriesConflictOut(BaseModel):
+    date_time: datetime
+    reason: str
+
+class AppointmentSeriesOut(BaseModel):
+    series_id: Optional[str] = None
+    created: List[AppointmentOut]
+    conflicts: List[SeriesConflictOut]
+
+class BusySlotOut(BaseModel):
+    time: str
+    duration: int
+
+class AvailableSlotOut(BaseModel):
+    date_time: datetime
+    date: str
+    time: str
+    duration: int
+
+class ScheduleOut(BaseModel):
+    id: int
+    day_of_week: Optional[str] = None
+    is_open: Optional[bool] = None
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+
+class ScheduleOverrideOut(BaseModel):
+    id: int
+    date: str
+    is_open: bool
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    note: Optional[str] = None
+
+class TimeRangeOut(BaseModel):
+    start: str
+    end: str
+
+class ScheduleDayOut(BaseModel):
+    date: str
+    is_open: bool
+    ranges: List[TimeRangeOut]
+
+class PublicProfileOut(BaseModel):
+    name: Optional[str] = None
+    slug: Optional[str] = None
+    specialty: Optional[str] = None
+    bio: Optional[str] = None
+    avatar_url: Optional[str] = None
+    appointment_interval: Optional[int] = None
+
+class ProfileOut(PublicProfileOut):
+    monthly_goal: Optional[int] = None
+
+class TokenOut(BaseModel):
+    access_token: str
+    token_type: str
+    is_admin: Optional[bool] = None
+
+class UploadOut(BaseModel):
+    url: str
+
+class MonthlyHistoryOut(BaseModel):
+    id: int
+    month_label: Optional[str] = None
+    total_earnings: Optional[int] = None
+    total_appointments: Optional[int] = None
+    date_code: Optional[str] = None
+
+class ArchivedAppointmentOut(BaseModel):
+    id: int
+    service_id: Optional[int] = None
+    service_name: Optional[str] = None
+    staff_id: Optional[int] = None
+    customer_id: Optional[int] = None
+    customer_name: Optional[str] = None
+    customer_email: Optional[str] = None
+    customer_phone: Optional[str] = None
+    date_time: Optional[datetime] = None
+    price: Optional[int] = None
+    status: Optional[str] = None
+
+class ArchiveQueryOut(BaseModel):
+    months: int
+    total_matches: int
+    total_earnings: int
+    appointments: List[ArchivedAppointmentOut]
+
+class ServiceAnalyticsOut(BaseModel):
+    service_id: Optional[int] = None
+    service_name: Optional[str] = None
+    completed: int
+    cancelled: int
+    revenue: int
+
+class HeatmapCellOut(BaseModel):
+    weekday: int
+    hour: int
+    completed: int
+    cancelled: int
+
+class RollupRebuildOut(BaseModel):
+    daily_rows: int
+    hourly_rows: int
+
+class CustomerOut(BaseModel):
+    id: int
+    name: Optional[str] = None
+    email: Optional[str] = None
+    phone: Optional[str] = None
+    visits: Optional[int] = None
+    last_seen_at: Optional[datetime] = None
+
+class CalendarTokenOut(BaseModel):
+    token: str
+    url: str
+
+class AdminUserOut(BaseModel):
+    id: int
+    username: str
+    is_admin: Optional[bool] = None
+    subscription_active: Optional[bool] = None
+    created_at: Optional[datetime] = None
+    is_active: Optional[bool] = None
+    profile_name: str
+
+class IntegrationStatusOut(BaseModel):
+    name: str
+    state: str
+    consecutive_failures: int
+    in_flight: int
+    max_concurrent: int
+    timeout: float
+    calls: int
+    successes: int
+    failures: int
+    timeouts: int
+    rejected: int
+    short_circuited: int
+    last_error: Optional[str] = None
+    last_latency_ms: Optional[float] = None
+
+class PurgeJobOut(BaseModel):
+    id: str
+    owner_id: int
+    status: str
+    current_step: Optional[str] = None
+    steps_done: int
+    steps_total: int
+    deleted_rows: int
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class RequestProfileSummaryOut(BaseModel):
+    id: str
+    method: str
+    path: str
+    query: str
+    status: Optional[int] = None
+    user_id: int
+    started_at: datetime
+    duration_ms: Optional[float] = None
+    sample_count: int
+    sql_count: int
+    sql_time_ms: float
+
+class ProfileStackOut(BaseModel):
+    stack: str
+    samples: int
+
+class ProfileQueryOut(BaseModel):
+    statement: str
+    duration_ms: float
+    rows: Optional[int] = None
+    executemany: bool
+
+class RequestProfileOut(RequestProfileSummaryOut):
+    sample_interval_ms: float
+    stacks: List[ProfileStackOut]
+    sql: List[ProfileQueryOut]
+    dropped_queries: int
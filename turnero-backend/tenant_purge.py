@@ -0,0 +1,156 @@
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+import models
+from database import SessionLocal
+from schedule_cache import invalidate_schedule
+from calendar_feed import forget_calendar
+
+# Filas por transacción: cada lote se borra y confirma por separado,
+# así ningún lock dura más que el borrado de un lote.
+PURGE_BATCH_SIZE = 500
+# Los archivos mensuales son blobs grandes; van en lotes más chicos
+PURGE_ARCHIVE_BATCH_SIZE = 20
+# Un job "running" que no avanzó en este tiempo se considera muerto (ej. reinicio
+# del worker) y un nuevo pedido de borrado lo retoma desde donde quedó.
+PURGE_STALE_AFTER = timedelta(minutes=10)
+
+
+def _unlink_services(db: Session, ids):
+    db.execute(models.service_staff.delete().where(models.service_staff.c.service_id.in_(ids)))
+
+
+def _unlink_staff(db: Session, ids):
+    db.execute(models.service_staff.delete().where(models.service_staff.c.staff_id.in_(ids)))
+
+
+# (paso, modelo, tamaño de lote, limpieza previa de cada lote), en orden de
+# dependencias: primero lo que referencia a otras tablas del negocio.
+PURGE_STEPS = [
+    ("appointments", models.Appointment, PURGE_BATCH_SIZE, None),
+    ("staff", models.Staff, PURGE_BATCH_SIZE, _unlink_staff),
+    ("services", models.Service, PURGE_BATCH_SIZE, _unlink_services),
+    ("customer_terms", models.CustomerTerm, PURGE_BATCH_SIZE, None),
+    ("customers", models.Customer, PURGE_BATCH_SIZE, None),
+    ("schedules", models.Schedule, PURGE_BATCH_SIZE, None),
+    ("schedule_overrides", models.ScheduleOverride, PURGE_BATCH_SIZE, None),
+    ("monthly_history", models.MonthlyHistory, PURGE_BATCH_SIZE, None),
+    ("appointment_archives", models.AppointmentArchive, PURGE_ARCHIVE_BATCH_SIZE, None),
+    ("service_daily_rollups", models.ServiceDailyRollup, PURGE_BATCH_SIZE, None),
+    ("hourly_rollups", models.HourlyRollup, PURGE_BATCH_SIZE, None),
+    ("profile", models.Profile, PURGE_BATCH_SIZE, None),
+]
+
+
+# Tablas a las que apuntan los turnos: antes de borrarlas se vuelve a barrer
+# `appointments`, por si entró una reserva después de ese paso.
+REFERENCED_BY_APPOINTMENTS = (models.Staff, models.Service, models.Customer)
+
+
+def active_purge_job(db: Session, owner_id: int):
+    """Job en curso para el negocio, si lo hay y no quedó abandonado."""
+    return db.query(models.PurgeJob).filter(
+        models.PurgeJob.owner_id == owner_id,
+        models.PurgeJob.status.in_(("pending", "running")),
+        models.PurgeJob.updated_at >= datetime.utcnow() - PURGE_STALE_AFTER
+    ).order_by(models.PurgeJob.created_at.desc()).first()
+
+
+def create_purge_job(db: Session, user: models.User, requested_by: int) -> models.PurgeJob:
+    """
+    Desactiva al usuario (su página pública y sus reservas dejan de funcionar),
+    lo marca como en eliminación (get_current_user y /token lo rechazan) y
+    registra el job. Hace commit; el borrado lo hace run_purge_job.
+    """
+    user.is_active = False
+    user.purge_requested_at = user.purge_requested_at or datetime.utcnow()
+    job = models.PurgeJob(id=str(uuid.uuid4()), owner_id=user.id, requested_by=requested_by, status="pending")
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def _purge_step(db: Session, job: models.PurgeJob, model, batch_size: int, before_delete):
+    while True:
+        ids = [row[0] for row in db.query(model.id).filter(
+            model.owner_id == job.owner_id
+        ).order_by(model.id).limit(batch_size)]
+        if not ids:
+            return
+        if before_delete:
+            before_delete(db, ids)
+        deleted = db.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+        # El avance se guarda en la misma transacción que el lote
+        job.deleted_rows = (job.deleted_rows or 0) + deleted
+        db.commit()
+
+
+def run_purge_job(job_id: str):
+    """
+    Borra todos los datos del negocio en lotes y al final el usuario. Corre en
+    segundo plano con su propia sesión. Si se corta, volver a pedir el borrado
+    retoma lo que falte: cada paso solo busca las filas que quedan.
+    """
+    db = SessionLocal()
+    try:
+        job = db.query(models.PurgeJob).filter(models.PurgeJob.id == job_id).first()
+        if job is None:
+            return
+        job.status = "running"
+        db.commit()
+        try:
+            for step, model, batch_size, before_delete in PURGE_STEPS:
+                job.current_step = step
+                db.commit()
+                if model in REFERENCED_BY_APPOINTMENTS:
+                    _purge_step(db, job, models.Appointment, PURGE_BATCH_SIZE, None)
+                _purge_step(db, job, model, batch_size, before_delete)
+
+            # Última pasada antes de borrar el usuario: en general no encuentra
+            # nada, pero cubre filas escritas mientras corrían los pasos anteriores.
+            job.current_step = "users"
+            db.commit()
+            for _, model, batch_size, before_delete in PURGE_STEPS:
+                _purge_step(db, job, model, batch_size, before_delete)
+            deleted = db.query(models.User).filter(models.User.id == job.owner_id).delete(synchronize_session=False)
+            job.deleted_rows = (job.deleted_rows or 0) + deleted
+            job.status = "done"
+            job.current_step = None
+            job.finished_at = datetime.utcnow()
+            db.commit()
+            print(f"Negocio {job.owner_id} eliminado: {job.deleted_rows} filas.")
+        except Exception as e:
+            db.rollback()
+            print(f"Error eliminando el negocio {job.owner_id} en '{job.current_step}': {e}")
+            job.status = "failed"
+            job.error = str(e)[:500]
+            job.finished_at = datetime.utcnow()
+            db.commit()
+        finally:
+            invalidate_schedule(job.owner_id)
+            forget_calendar(job.owner_id)
+    finally:
+        db.close()
+
+
+def purge_job_status(job: models.PurgeJob) -> dict:
+    steps = [step for step, *_ in PURGE_STEPS] + ["users"]
+    if job.status == "done":
+        steps_done = len(steps)
+    elif job.current_step in steps:
+        steps_done = steps.index(job.current_step)
+    else:
+        steps_done = 0
+    return {
+        "id": job.id,
+        "owner_id": job.owner_id,
+        "status": job.status,
+        "current_step": job.current_step,
+        "steps_done": steps_done,
+        "steps_total": len(steps),
+        "deleted_rows": job.deleted_rows or 0,
+        "error": job.error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
@@ -0,0 +1,161 @@
+"""
+Timeouts, bulkhead y circuit breaker de integrations.Provider contra el servidor
+falso de fake_providers.py, con latencia y errores inyectados.
+
+Uso: python -m pytest tests
+"""
+import threading
+import time
+import urllib.request
+from urllib.error import HTTPError
+
+import pytest
+from storage3 import SyncStorageClient
+from storage3.exceptions import StorageApiError
+
+import integrations
+from integrations import (
+    Provider, CircuitOpenError, BulkheadFullError, ProviderTimeoutError,
+    CLOSED, OPEN, HALF_OPEN,
+)
+from fake_providers import FakeProviderServer
+
+
+@pytest.fixture
+def server():
+    with FakeProviderServer() as server:
+        yield server
+
+
+def send_email(server):
+    request = urllib.request.Request(f"{server.url}/v3/smtp/email", data=b"{}", method="POST")
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return response.status
+
+
+def wait_until(condition, timeout=3):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("la condición no se cumplió a tiempo")
+        time.sleep(0.01)
+
+
+def test_breaker_opens_after_consecutive_failures(server):
+    server.config.update({"error_rate": 1, "error_status": 503})
+    provider = Provider("test", failure_threshold=3, reset_timeout=60)
+
+    for _ in range(3):
+        with pytest.raises(HTTPError):
+            provider.call(send_email, server)
+    assert provider.breaker.state == OPEN
+
+    # Con el circuito abierto no se llama al proveedor
+    with pytest.raises(CircuitOpenError):
+        provider.call(send_email, server)
+    assert server.config.hits["brevo.send_transac_email"] == 3
+    assert provider.snapshot()["short_circuited"] == 1
+
+
+def test_success_resets_consecutive_failures(server):
+    provider = Provider("test", failure_threshold=2, reset_timeout=60)
+    server.config.update({"error_rate": 1})
+    with pytest.raises(HTTPError):
+        provider.call(send_email, server)
+    server.config.update({"error_rate": 0})
+    assert provider.call(send_email, server) == 201
+    server.config.update({"error_rate": 1})
+    with pytest.raises(HTTPError):
+        provider.call(send_email, server)
+    assert provider.breaker.state == CLOSED
+
+
+def test_half_open_lets_a_single_trial_through(server):
+    server.config.update({"error_rate": 1})
+    provider = Provider("test", failure_threshold=1, reset_timeout=0.2)
+    with pytest.raises(HTTPError):
+        provider.call(send_email, server)
+    assert provider.breaker.state == OPEN
+
+    time.sleep(0.25)
+    server.config.update({"error_rate": 0, "latency": 0.3})
+    results = []
+    trial = threading.Thread(target=lambda: results.append(provider.call(send_email, server)))
+    trial.start()
+    wait_until(lambda: provider.breaker.state == HALF_OPEN)
+
+    # Mientras la prueba está en curso el resto sigue rechazándose
+    with pytest.raises(CircuitOpenError):
+        provider.call(send_email, server)
+    trial.join()
+    assert results == [201]
+    assert provider.breaker.state == CLOSED
+
+
+def test_failed_trial_reopens_the_circuit(server):
+    server.config.update({"error_rate": 1})
+    provider = Provider("test", failure_threshold=1, reset_timeout=0.2)
+    with pytest.raises(HTTPError):
+        provider.call(send_email, server)
+
+    time.sleep(0.25)
+    with pytest.raises(HTTPError):
+        provider.call(send_email, server)
+    assert provider.breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        provider.call(send_email, server)
+
+
+def test_timeout_keeps_the_slot_until_the_call_really_ends(server):
+    server.config.update({"latency": 0.5})
+    provider = Provider("test", timeout=0.1, max_concurrent=1, queue_timeout=0.05, failure_threshold=5)
+
+    started = time.monotonic()
+    with pytest.raises(ProviderTimeoutError):
+        provider.call(send_email, server)
+    assert time.monotonic() - started < 0.4
+
+    # La llamada vencida sigue corriendo y ocupa el único lugar
+    assert provider.in_flight == 1
+    with pytest.raises(BulkheadFullError):
+        provider.call(send_email, server)
+
+    wait_until(lambda: provider.in_flight == 0)
+    server.config.update({"latency": 0})
+    assert provider.call(send_email, server) == 201
+    snapshot = provider.snapshot()
+    assert (snapshot["timeouts"], snapshot["rejected"], snapshot["successes"]) == (1, 1, 1)
+
+
+def test_client_errors_do_not_open_the_breaker(server):
+    server.config.update({"error_rate": 1, "error_status": 400})
+    provider = Provider("test", failure_threshold=1, is_failure=integrations.is_provider_failure)
+    for _ in range(3):
+        with pytest.raises(HTTPError):
+            provider.call(send_email, server)
+    assert provider.breaker.state == CLOSED
+
+    server.config.update({"error_status": 429})
+    with pytest.raises(HTTPError):
+        provider.call(send_email, server)
+    assert provider.breaker.state == OPEN
+
+
+def storage_upload(server, name):
+    storage = SyncStorageClient(f"{server.url}/storage/v1/", {"Authorization": "Bearer fake"})
+    return storage.from_("Images").upload(name, b"data", {"content-type": "image/png"})
+
+
+def test_supabase_duplicate_upload_does_not_open_the_breaker(server):
+    assert integrations.supabase_provider.is_failure is integrations.is_provider_failure
+    provider = Provider("supabase-test", failure_threshold=1, is_failure=integrations.is_provider_failure)
+
+    server.config.update({"error_rate": 1, "error_status": 409})
+    with pytest.raises(StorageApiError):
+        provider.call(storage_upload, server, "avatar.png")
+    assert provider.breaker.state == CLOSED
+
+    server.config.update({"error_status": 503})
+    with pytest.raises(StorageApiError):
+        provider.call(storage_upload, server, "avatar.png")
+    assert provider.breaker.state == OPEN